@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark CPU inference modes: load time, generation latency and peak RSS per configuration
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# "current" is the path used before the cpu_inference config existed
+CONFIGURATIONS = {
+    "current": {},
+    "fp32": {"dtype": "float32"},
+    "bf16": {"dtype": "bfloat16"},
+    "int8": {"dtype": "float32", "int8_dynamic_quantization": True},
+    "int8+compile": {"dtype": "float32", "int8_dynamic_quantization": True, "compile": True},
+}
+
+QUERIES = [
+    "What is Section 66C of the IT Act?",
+    "What are the penalties for hacking in India?",
+    "How do I report a cybercrime?",
+    "Explain Section 43A about data protection",
+]
+
+
+def run_worker(model_path, cpu_config, max_new_tokens, num_threads):
+    import torch
+    from cyber_saarthi.inference import CyberSaarthiModel
+
+    if num_threads:
+        cpu_config = dict(cpu_config, num_threads=num_threads)
+
+    start = time.perf_counter()
+    model = CyberSaarthiModel(model_path, cpu_config=cpu_config)
+    load_time = time.perf_counter() - start
+
+    # One untimed call so torch.compile and allocator warm-up are not counted
+    model.generate(QUERIES[0], max_new_tokens=8, do_sample=False)
+
+    latencies = []
+    for query in QUERIES:
+        start = time.perf_counter()
+        model.generate(query, max_new_tokens=max_new_tokens, do_sample=False)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "load_time_sec": load_time,
+        "mean_latency_sec": sum(latencies) / len(latencies),
+        "ms_per_token": sum(latencies) / len(latencies) / max_new_tokens * 1000,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "threads": torch.get_num_threads(),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare CPU inference modes")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the model")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens to generate per query")
+    parser.add_argument("--num-threads", type=int, default=None, help="torch.set_num_threads for every mode")
+    parser.add_argument("--modes", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.model_path, CONFIGURATIONS[args.worker], args.max_new_tokens, args.num_threads)
+        print("RESULT " + json.dumps(result))
+        return
+
+    results = {}
+    for mode in args.modes:
+        print(f"Benchmarking {mode}...")
+        # A fresh process per mode keeps peak RSS numbers independent
+        command = [sys.executable, __file__, "--worker", mode, "--model-path", args.model_path,
+                   "--max-new-tokens", str(args.max_new_tokens)]
+        if args.num_threads:
+            command += ["--num-threads", str(args.num_threads)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+        if completed.returncode != 0 or not lines:
+            print(f"  ✗ {mode} failed:\n{completed.stderr[-2000:]}")
+            continue
+        results[mode] = json.loads(lines[-1][len("RESULT "):])
+
+    print("\n" + "=" * 78)
+    print(f"{'Mode':14s} {'Load (s)':>10s} {'Latency (s)':>12s} {'ms/token':>10s} {'Peak RSS (MB)':>15s}")
+    print("=" * 78)
+    for mode, r in results.items():
+        print(f"{mode:14s} {r['load_time_sec']:10.2f} {r['mean_latency_sec']:12.3f} "
+              f"{r['ms_per_token']:10.2f} {r['peak_rss_mb']:15.1f}")
+
+    if "current" in results:
+        baseline = results["current"]["mean_latency_sec"]
+        print("\nSpeedup vs current path:")
+        for mode, r in results.items():
+            print(f"  {mode:14s}: {baseline / r['mean_latency_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
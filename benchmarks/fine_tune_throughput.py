@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Training throughput (real tokens/s) of the fine_tune batching modes: padding, group_by_length and packing.
+
+Runs a few LoRA steps per mode on the same data. Without --model-path a tiny random
+model is used, which is enough to compare how many real tokens each mode gets through.
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.fine_tune import (
+    ThroughputCallback,
+    batching_mode,
+    build_training_data,
+    format_instruction,
+    load_config,
+    tokenize_function,
+)
+
+MODES = {
+    "padding": {"packing": False, "group_by_length": False},
+    "group_by_length": {"packing": False, "group_by_length": True},
+    "packing": {"packing": True, "group_by_length": False},
+}
+
+
+def run(model_path, dataset, config, mode, max_steps, batch_size):
+    import copy
+
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoModelForCausalLM, AutoTokenizer, Trainer, TrainingArguments
+
+    config = copy.deepcopy(config)
+    config["training"].update(MODES[mode])
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+    model = AutoModelForCausalLM.from_pretrained(model_path)
+    lora = config["lora"]
+    model = get_peft_model(model, LoraConfig(
+        r=lora["r"], lora_alpha=lora["lora_alpha"], target_modules=lora["target_modules"],
+        lora_dropout=lora["lora_dropout"], bias=lora["bias"], task_type=lora["task_type"],
+    ))
+
+    tokenized_dataset = dataset.map(
+        lambda x: tokenize_function(x, tokenizer, config["model"]["max_length"]), batched=True,
+        remove_columns=["text", "response_offset"], load_from_cache_file=False,
+    )
+    train_dataset, _, data_collator, mode_args = build_training_data(
+        tokenized_dataset, tokenizer, config
+    )
+    callback = ThroughputCallback(batching_mode(config))
+    with tempfile.TemporaryDirectory() as output_dir:
+        args = TrainingArguments(
+            output_dir=output_dir,
+            per_device_train_batch_size=batch_size,
+            max_steps=max_steps,
+            learning_rate=1e-4,
+            logging_steps=max_steps,
+            save_strategy="no",
+            report_to="none",
+            **mode_args,
+        )
+        trainer = Trainer(
+            model=model, args=args, train_dataset=train_dataset, data_collator=data_collator,
+            processing_class=tokenizer, callbacks=[callback],
+        )
+        trainer.train()
+    return {
+        "tokens_per_sec": callback.tokens_per_sec,
+        "examples_per_step": len(dataset["train"]) / len(train_dataset) * batch_size,
+        "train_loss": trainer.state.log_history[-1].get("train_loss"),
+    }
+
+
+def main():
+    import argparse
+
+    from datasets import load_dataset
+
+    parser = argparse.ArgumentParser(description="Compare fine_tune batching modes by training throughput")
+    parser.add_argument("--model-path", default=None, help="Model to train (default: tiny random model)")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Training examples")
+    parser.add_argument("--max-steps", type=int, default=20, help="Optimizer steps per mode")
+    parser.add_argument("--batch-size", type=int, default=4, help="per_device_train_batch_size")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    config = load_config()
+    model_path = args.model_path
+    if model_path is None:
+        from cyber_saarthi.tiny_model import create_tiny_model
+
+        model_path = create_tiny_model("./models/tiny-random")
+
+    dataset = load_dataset("json", data_files={"train": args.data_file, "validation": args.data_file})
+    dataset = dataset.map(
+        format_instruction, remove_columns=["instruction", "input", "output"], load_from_cache_file=False
+    )
+
+    results = {mode: run(model_path, dataset, config, mode, args.max_steps, args.batch_size) for mode in args.modes}
+
+    print("\n" + "=" * 70)
+    print(f"{'Mode':18s} {'Tokens/s':>12s} {'Examples/step':>15s} {'Train loss':>12s}")
+    print("=" * 70)
+    for mode, r in results.items():
+        print(f"{mode:18s} {r['tokens_per_sec']:12.1f} {r['examples_per_step']:15.1f} {r['train_loss']:12.4f}")
+    if "padding" in results:
+        baseline = results["padding"]["tokens_per_sec"]
+        for mode, r in results.items():
+            if mode != "padding" and baseline:
+                print(f"{mode}: {r['tokens_per_sec'] / baseline:.2f}x padding throughput")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the inference entry points, based on `python -X importtime`
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = ["cyber_saarthi", "cyber_saarthi.inference", "cyber_saarthi.cache"]
+
+# None of these should be imported just to render the UI or print --help
+HEAVY_MODULES = {"torch", "transformers", "peft", "bitsandbytes", "accelerate"}
+
+
+def profile_import(module):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        check=True,
+    )
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = next(cumulative for name, _, cumulative in entries if name == module)
+    heavy = sorted({name.split(".")[0] for name, _, _ in entries} & HEAVY_MODULES)
+    return total_us, heavy, entries
+
+
+def time_cli_help():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "cyber_saarthi.inference", "--help"],
+        capture_output=True,
+        cwd=REPO_ROOT,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure import time of Cyber Saarthi modules")
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest imports per module")
+    parser.add_argument("--max-seconds", type=float, default=1.0,
+                        help="Fail if `--help` takes longer than this")
+    args = parser.parse_args()
+
+    failed = False
+    print("=" * 70)
+    print("Import time (python -X importtime)")
+    print("=" * 70)
+    for module in MODULES:
+        total_us, heavy, entries = profile_import(module)
+        print(f"\n{module}: {total_us / 1000:.1f} ms")
+        others = [entry for entry in entries if entry[0] != module]
+        for name, _, cumulative in sorted(others, key=lambda e: e[2], reverse=True)[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+        if heavy:
+            print(f"  ✗ pulls in heavy dependencies at import: {', '.join(heavy)}")
+            failed = True
+
+    help_seconds = time_cli_help()
+    print(f"\npython -m cyber_saarthi.inference --help: {help_seconds:.2f}s (limit {args.max_seconds:.2f}s)")
+    if help_seconds > args.max_seconds:
+        print("  ✗ CLI startup is over the limit")
+        failed = True
+
+    print("\n❌ FAIL" if failed else "\n✅ PASS")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
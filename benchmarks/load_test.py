@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test that replays chat traffic against one node.
+
+Questions are drawn from data/cyber_laws_qa.jsonl and the UI's EXAMPLE_QUERIES with
+Zipf popularity (a few questions are asked far more often than the rest), and arrive
+as a Poisson process at a fixed rate whether or not earlier requests have finished.
+Latency is measured from each request's scheduled arrival, so a backed-up node shows
+up as queueing delay instead of silently slowing the load down.
+
+The target is either the model in-process behind the same continuous-batching
+scheduler the server uses, or any running server's /v1/chat/completions:
+
+    python benchmarks/load_test.py --rates 1 2 4 8                      # tiny model, in-process
+    python benchmarks/load_test.py --url http://localhost:8000 --rates 2 4
+"""
+import asyncio
+import bisect
+import json
+import math
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.inference import EXAMPLE_QUERIES, load_config
+
+
+def load_questions(data_file, extra=EXAMPLE_QUERIES):
+    """Unique instructions from the dataset plus the example queries, in first-seen order"""
+    with open(data_file, "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["instruction"] for line in f if line.strip()]
+    return list(dict.fromkeys(list(extra) + questions))
+
+
+class ZipfSampler:
+    """Draws items with probability proportional to 1 / rank**exponent (0 = uniform).
+
+    Ranks are assigned after a seeded shuffle, so popularity does not follow file order.
+    """
+
+    def __init__(self, items, exponent=1.0, seed=0):
+        self.rng = random.Random(seed)
+        self.items = list(items)
+        self.rng.shuffle(self.items)
+        self.cumulative = []
+        total = 0.0
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** exponent
+            self.cumulative.append(total)
+
+    def sample(self):
+        return self.items[bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+def arrival_times(rate, duration, process="poisson", seed=0):
+    """Request start offsets in seconds over [0, duration)"""
+    rng = random.Random(seed)
+    times, t = [], 0.0
+    while True:
+        t += rng.expovariate(rate) if process == "poisson" else 1.0 / rate
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class InProcessTarget:
+    """CyberSaarthiModel behind a ContinuousBatchingScheduler, as the server runs it"""
+
+    def __init__(self, model, scheduler, gen_kwargs):
+        self.model = model
+        self.scheduler = scheduler
+        self.gen_kwargs = gen_kwargs
+
+    async def request(self, instruction, record):
+        from cyber_saarthi.scheduler import AsyncStreamQueue
+
+        stream_queue = AsyncStreamQueue(asyncio.get_running_loop())
+        request = await asyncio.to_thread(
+            self.scheduler.submit, instruction, stream_queue=stream_queue, **self.gen_kwargs
+        )
+        try:
+            async for chunk in stream_queue:
+                if chunk and record.get("first_token_at") is None:
+                    record["first_token_at"] = time.perf_counter()
+            await asyncio.wrap_future(request.future)
+        finally:
+            # A timed-out request stops generating instead of holding its batch slot
+            request.cancel()
+        record["tokens"] = len(request.generated_ids)
+
+    def close(self):
+        self.scheduler.shutdown(wait=False)
+
+
+class HTTPTarget:
+    """Streaming /v1/chat/completions client on plain asyncio streams (one connection per request)"""
+
+    def __init__(self, url, gen_kwargs, model_name="cyber-saarthi"):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path.rstrip("/") + "/v1/chat/completions"
+        self.payload = {
+            "model": model_name,
+            "stream": True,
+            "max_tokens": gen_kwargs["max_new_tokens"],
+            "temperature": gen_kwargs["temperature"] if gen_kwargs["do_sample"] else 0,
+            "top_p": gen_kwargs["top_p"],
+        }
+
+    async def request(self, instruction, record):
+        body = json.dumps({**self.payload, "messages": [{"role": "user", "content": instruction}]}).encode("utf-8")
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write((
+                f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            ).encode("latin-1") + body)
+            await writer.drain()
+
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}: {(await reader.read()).decode('utf-8', 'replace')[:200]}")
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise RuntimeError("Stream ended without [DONE]")
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: "):].strip()
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    raise RuntimeError(event["error"].get("message", "server error"))
+                delta = event["choices"][0].get("delta", {})
+                if delta.get("content") and record.get("first_token_at") is None:
+                    record["first_token_at"] = time.perf_counter()
+                if event.get("usage"):
+                    record["tokens"] = event["usage"]["completion_tokens"]
+        finally:
+            writer.close()
+
+    def close(self):
+        pass
+
+
+async def run_load(target, sampler, rate, duration, timeout, process="poisson", seed=0):
+    """Fire requests at the scheduled arrival times; returns one record per request and the wall time"""
+    records = []
+    in_flight = {"now": 0, "peak": 0}
+
+    async def fire(scheduled_at, instruction):
+        await asyncio.sleep(max(scheduled_at - time.perf_counter(), 0))
+        record = {"instruction": instruction, "scheduled_at": scheduled_at, "first_token_at": None, "tokens": 0}
+        records.append(record)
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            await asyncio.wait_for(target.request(instruction, record), timeout)
+            record["error"] = None
+        except asyncio.TimeoutError:
+            record["error"] = "timeout"
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["finished_at"] = time.perf_counter()
+        in_flight["now"] -= 1
+
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(fire(start + offset, sampler.sample()))
+        for offset in arrival_times(rate, duration, process, seed)
+    ]
+    await asyncio.gather(*tasks)
+    return records, time.perf_counter() - start, in_flight["peak"]
+
+
+def summarize(records, wall_time, rate, slo_ttft, slo_latency):
+    ok = [r for r in records if r["error"] is None]
+    latencies = [r["finished_at"] - r["scheduled_at"] for r in ok]
+    ttfts = [r["first_token_at"] - r["scheduled_at"] for r in ok if r["first_token_at"] is not None]
+    good = [
+        r for r in ok
+        if r["first_token_at"] is not None
+        and r["first_token_at"] - r["scheduled_at"] <= slo_ttft
+        and r["finished_at"] - r["scheduled_at"] <= slo_latency
+    ]
+    errors = {}
+    for r in records:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    summary = {
+        "offered_rps": rate,
+        "requests": len(records),
+        "completed": len(ok),
+        "errors": errors,
+        # Router and cache answers come back without generating a token
+        "answered_without_model": sum(r["tokens"] == 0 for r in ok),
+        "throughput_rps": len(ok) / wall_time if wall_time else 0.0,
+        "goodput_rps": len(good) / wall_time if wall_time else 0.0,
+        "slo_attainment": len(good) / len(records) if records else 0.0,
+        "tokens_per_sec": sum(r["tokens"] for r in ok) / wall_time if wall_time else 0.0,
+        "goodput_tokens_per_sec": sum(r["tokens"] for r in good) / wall_time if wall_time else 0.0,
+        "mean_latency_sec": sum(latencies) / len(latencies) if latencies else None,
+    }
+    for q in (50, 95, 99):
+        summary[f"latency_p{q}_sec"] = percentile(latencies, q)
+        summary[f"ttft_p{q}_sec"] = percentile(ttfts, q)
+    return summary
+
+
+def build_in_process_target(args, config, gen_kwargs):
+    from cyber_saarthi.inference import load_model_from_config
+    from cyber_saarthi.scheduler import ContinuousBatchingScheduler
+
+    model_path = args.model_path
+    if model_path is None:
+        from cyber_saarthi.tiny_model import create_tiny_model
+
+        model_path = create_tiny_model("./models/tiny-random")
+    overrides = {"warmup": True}
+    if args.no_cache:
+        overrides["response_cache"] = None
+    model = load_model_from_config(model_path, config, **overrides)
+    if args.no_cache:
+        model.semantic_cache = None
+        model.router = None
+    max_batch_size = args.max_batch_size or config.get("serving", {}).get("max_batch_size", 8)
+    return InProcessTarget(model, ContinuousBatchingScheduler(model, max_batch_size=max_batch_size), gen_kwargs)
+
+
+def main():
+    import argparse
+
+    config = load_config()
+    generation = config.get("generation", {})
+
+    parser = argparse.ArgumentParser(description="Open-loop load test with Zipf-distributed chat traffic")
+    parser.add_argument("--url", default=None, help="Server base URL; without it the model runs in-process")
+    parser.add_argument("--model-path", default=None, help="In-process model (default: tiny random model)")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Question pool")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1.0, 2.0, 4.0], help="Offered requests/sec to sweep")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of arrivals per rate")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson", help="Arrival process")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Zipf exponent of question popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens to generate per answer")
+    parser.add_argument("--greedy", action="store_true", help="Greedy decoding, so repeated questions can hit the cache")
+    parser.add_argument("--no-cache", action="store_true", help="In-process: disable the router and response caches")
+    parser.add_argument("--max-batch-size", type=int, default=None, help="In-process scheduler batch size")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-ttft", type=float, default=2.0, help="Goodput SLO: max seconds to first token")
+    parser.add_argument("--slo-latency", type=float, default=20.0, help="Goodput SLO: max seconds to full answer")
+    parser.add_argument("--slo-target", type=float, default=0.95, help="SLO attainment a rate must reach to count as sustained")
+    parser.add_argument("--think-time", type=float, default=30.0,
+                        help="Seconds a chat user reads and types between questions, for the concurrent-user estimate")
+    parser.add_argument("--output", default=None, help="Write the summaries as JSON")
+    args = parser.parse_args()
+
+    gen_kwargs = {
+        "max_new_tokens": args.max_new_tokens,
+        "temperature": generation.get("temperature", 0.7),
+        "top_p": generation.get("top_p", 0.9),
+        "top_k": generation.get("top_k", 50),
+        "repetition_penalty": generation.get("repetition_penalty", 1.1),
+        "do_sample": generation.get("do_sample", True) and not args.greedy,
+    }
+    if not gen_kwargs["do_sample"]:
+        gen_kwargs["temperature"] = 1.0
+
+    if args.url:
+        target = HTTPTarget(args.url, gen_kwargs, config.get("server", {}).get("model_name", "cyber-saarthi"))
+    else:
+        target = build_in_process_target(args, config, gen_kwargs)
+        target.model.wait_until_loaded()
+
+    questions = load_questions(args.data_file)
+    summaries = []
+    try:
+        for i, rate in enumerate(args.rates):
+            print(f"Offering {rate:g} req/s for {args.duration:g}s...")
+            sampler = ZipfSampler(questions, args.zipf, seed=args.seed + i)
+            records, wall_time, peak = asyncio.run(
+                run_load(target, sampler, rate, args.duration, args.timeout, args.arrival, seed=args.seed + i)
+            )
+            summary = summarize(records, wall_time, rate, args.slo_ttft, args.slo_latency)
+            summary["peak_in_flight"] = peak
+            summaries.append(summary)
+    finally:
+        target.close()
+
+    def fmt(value, scale=1.0):
+        return f"{value * scale:8.0f}" if value is not None else f"{'-':>8s}"
+
+    print("\n" + "=" * 111)
+    print(f"{len(questions)} questions, Zipf {args.zipf:g}, {args.arrival} arrivals, "
+          f"SLO: TTFT <= {args.slo_ttft:g}s and latency <= {args.slo_latency:g}s")
+    print("=" * 111)
+    print(f"{'Offered':>8s} {'Done':>6s} {'Err':>5s} {'Cached':>6s} {'req/s':>7s} {'Goodput':>8s} {'SLO %':>6s} {'tok/s':>7s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'TTFT p50':>8s} {'TTFT p95':>8s} {'TTFT p99':>8s}")
+    for s in summaries:
+        print(f"{s['offered_rps']:8.2f} {s['completed']:6d} {sum(s['errors'].values()):5d} "
+              f"{s['answered_without_model']:6d} "
+              f"{s['throughput_rps']:7.2f} {s['goodput_rps']:8.2f} {s['slo_attainment'] * 100:6.1f} "
+              f"{s['tokens_per_sec']:7.1f} {fmt(s['latency_p50_sec'], 1000)} {fmt(s['latency_p95_sec'], 1000)} "
+              f"{fmt(s['latency_p99_sec'], 1000)} {fmt(s['ttft_p50_sec'], 1000)} {fmt(s['ttft_p95_sec'], 1000)} "
+              f"{fmt(s['ttft_p99_sec'], 1000)}")
+
+    sustained = [s for s in summaries if s["slo_attainment"] >= args.slo_target and not s["errors"]]
+    if sustained:
+        best = max(sustained, key=lambda s: s["offered_rps"])
+        # Little's law: each user has one question in flight per (answer time + think time)
+        users = best["offered_rps"] * (best["mean_latency_sec"] + args.think_time)
+        print(f"\n✓ Sustained {best['offered_rps']:g} req/s at {args.slo_target:.0%} SLO attainment "
+              f"≈ {users:.0f} concurrent chat users at {args.think_time:g}s think time")
+    else:
+        print(f"\n✗ No offered rate met {args.slo_target:.0%} SLO attainment")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summaries": summaries}, f, indent=2)
+        print(f"✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
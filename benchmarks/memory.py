@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Per-process memory with and without memory-mapped weights.
+
+Starts several model processes per mode and keeps them all alive while reading
+RSS and PSS from /proc (Linux). PSS splits shared pages between the processes that
+map them, so it shows how much each extra process really costs.
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# "from_pretrained" is the previous loading path; whether it copies the weights into
+# private memory depends on the installed transformers version
+MODES = {
+    "from_pretrained": {"mmap_weights": False},
+    "mmap": {"mmap_weights": True},
+}
+
+
+def read_memory_mb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return values
+
+
+def run_worker(model_path, mode):
+    from cyber_saarthi.inference import CyberSaarthiModel, load_config
+
+    cpu_config = dict(load_config().get("cpu_inference") or {}, **MODES[mode])
+    start = time.perf_counter()
+    model = CyberSaarthiModel(model_path, cpu_config=cpu_config)
+    load_time = time.perf_counter() - start
+    # One short generation so the pages a real request touches are resident
+    model.generate("What is Section 66C of the IT Act?", max_new_tokens=8, do_sample=False)
+
+    print("READY " + json.dumps({"load_time_sec": load_time, "mmap": model.load_metrics.get("mmap_weights", False)}),
+          flush=True)
+    # Stay alive until the parent has measured every process
+    sys.stdin.readline()
+
+
+def measure(model_path, mode, num_processes):
+    processes = []
+    load_times = []
+    zero_copy = []
+    try:
+        # Load one after another so load times are not skewed by contention
+        for _ in range(num_processes):
+            process = subprocess.Popen(
+                [sys.executable, __file__, "--worker", mode, "--model-path", model_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+            processes.append(process)
+            for line in process.stdout:
+                if line.startswith("READY "):
+                    result = json.loads(line[len("READY "):])
+                    load_times.append(result["load_time_sec"])
+                    zero_copy.append(result["mmap"])
+                    break
+            else:
+                raise RuntimeError(f"{mode} worker exited before loading (code {process.wait()})")
+
+        memory = [read_memory_mb(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.stdin.close()
+                process.wait()
+
+    return {
+        "mean_load_time_sec": sum(load_times) / len(load_times),
+        "rss_mb": [m["rss"] for m in memory],
+        "pss_mb": [m["pss"] for m in memory],
+        "total_pss_mb": sum(m["pss"] for m in memory),
+        "zero_copy": all(zero_copy),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure per-process RSS/PSS with and without mmap weight loading")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the model")
+    parser.add_argument("--num-processes", type=int, default=3, help="Model processes alive at once per mode")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.model_path, args.worker)
+        return
+
+    results = {}
+    for mode in args.modes:
+        print(f"Measuring {mode} with {args.num_processes} processes...")
+        results[mode] = measure(args.model_path, mode, args.num_processes)
+
+    print("\n" + "=" * 84)
+    print(f"{'Mode':16s} {'Load (s)':>10s} {'RSS/proc (MB)':>15s} {'PSS/proc (MB)':>15s} {'Total PSS (MB)':>16s}")
+    print("=" * 84)
+    for mode, r in results.items():
+        rss = sum(r["rss_mb"]) / len(r["rss_mb"])
+        pss = sum(r["pss_mb"]) / len(r["pss_mb"])
+        print(f"{mode:16s} {r['mean_load_time_sec']:10.2f} {rss:15.1f} {pss:15.1f} {r['total_pss_mb']:16.1f}")
+        if mode == "mmap" and not r["zero_copy"]:
+            print("  ✗ weights were converted on load, export them in cpu_inference.dtype to share them")
+
+    if "from_pretrained" in results and "mmap" in results:
+        saved = results["from_pretrained"]["total_pss_mb"] - results["mmap"]["total_pss_mb"]
+        print(f"\nMemory saved across {args.num_processes} processes: {saved:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: prompt prefill time with and without the cached instruction preamble
+"""
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.inference import CyberSaarthiModel
+
+
+def load_instructions(data_file, limit):
+    with open(data_file, "r", encoding="utf-8") as f:
+        return [json.loads(line)["instruction"] for line in f if line.strip()][:limit]
+
+
+def time_prefill(model, prompts, repeats):
+    timings = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            for prompt in prompts:
+                inputs = model._prepare_inputs([prompt])
+                past_key_values = inputs.get("past_key_values")
+                n_cached = past_key_values.get_seq_length() if past_key_values is not None else 0
+
+                start = time.perf_counter()
+                model.model(
+                    input_ids=inputs["input_ids"][:, n_cached:],
+                    attention_mask=inputs["attention_mask"],
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark preamble KV-cache reuse during prefill")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the model")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Instructions to prefill")
+    parser.add_argument("--num-prompts", type=int, default=50, help="Number of instructions to use")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the instructions")
+    args = parser.parse_args()
+
+    prompts_source = load_instructions(args.data_file, args.num_prompts)
+
+    results = {}
+    for use_prefix_cache in (False, True):
+        model = CyberSaarthiModel(args.model_path, use_prefix_cache=use_prefix_cache)
+        prompts = [model.format_prompt(instruction) for instruction in prompts_source]
+        # Warm up kernels and allocator before timing
+        time_prefill(model, prompts[:2], 1)
+        timings = time_prefill(model, prompts, args.repeats)
+        results[use_prefix_cache] = timings
+        del model
+
+    print("\n" + "=" * 70)
+    print(f"Prefill latency over {len(prompts_source)} prompts x {args.repeats} repeats")
+    print("=" * 70)
+    for use_prefix_cache, timings in results.items():
+        label = "with prefix cache" if use_prefix_cache else "full prompt"
+        print(f"  {label:20s}: mean {statistics.mean(timings) * 1000:7.2f} ms | "
+              f"p50 {statistics.median(timings) * 1000:7.2f} ms")
+    speedup = statistics.mean(results[False]) / statistics.mean(results[True])
+    print(f"\nPrefill speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
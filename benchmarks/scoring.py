@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Scoring throughput on synthetic responses: per-keyword `in` scans and pure-Python
+token-F1/LCS versus the batched engine in cyber_saarthi.scoring. The keyword rows check
+each response's own keywords, and every keyword of the run against every response.
+"""
+import json
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from cyber_saarthi.evaluate import extract_keywords
+from cyber_saarthi.scoring import keyword_scores, rouge_l_batch, score_responses, token_f1_batch, tokenize
+
+
+def synthesize(references, num_responses, seed):
+    """Responses that paraphrase a reference: dropped, duplicated and swapped words, cut short"""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(num_responses):
+        reference = rng.choice(references)
+        words = reference.split()
+        words = [w for w in words if rng.random() > 0.15]
+        words += rng.sample(words, k=min(len(words), rng.randint(0, 10)))
+        for _ in range(rng.randint(0, 5)):
+            i, j = rng.randrange(len(words)), rng.randrange(len(words))
+            words[i], words[j] = words[j], words[i]
+        pairs.append((" ".join(words[:rng.randint(len(words) // 2, len(words))]), reference))
+    return pairs
+
+
+def baseline_keywords(responses, keyword_lists):
+    # What test_model_accuracy.evaluate_response did: one substring scan per keyword
+    results = []
+    for response, keywords in zip(responses, keyword_lists):
+        lower = response.lower()
+        matches = [kw for kw in keywords if kw.lower() in lower]
+        results.append((len(matches) / len(keywords) * 100 if keywords else None, matches))
+    return results
+
+
+def baseline_f1(prediction, reference):
+    pred, ref = tokenize(prediction), tokenize(reference)
+    common = sum((Counter(pred) & Counter(ref)).values())
+    if not common:
+        return 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def baseline_rouge_l(prediction, reference):
+    pred, ref = tokenize(prediction), tokenize(reference)
+    previous = [0] * (len(ref) + 1)
+    for token in pred:
+        current = [0]
+        for j, other in enumerate(ref):
+            current.append(previous[j] + 1 if token == other else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(pred), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def timed(fn, *args, repeats=1):
+    # Best of `repeats` runs; the keyword rows take milliseconds and are noisy otherwise
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation scoring engine")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="References to paraphrase")
+    parser.add_argument("--num-responses", type=int, default=10000, help="Synthetic responses to score")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.data_file, "r", encoding="utf-8") as f:
+        references = [json.loads(line)["output"] for line in f if line.strip()]
+    pairs = synthesize(references, args.num_responses, args.seed)
+    responses = [p for p, _ in pairs]
+    refs = [r for _, r in pairs]
+    keyword_lists = [extract_keywords(r) for r in refs]
+    num_tokens = sum(len(tokenize(r)) for r in responses)
+
+    # Coverage audit: every response against every keyword of the run
+    all_keywords = sorted({kw for keywords in keyword_lists for kw in keywords})
+    base_all, base_all_time = timed(baseline_keywords, responses, [all_keywords] * len(responses), repeats=5)
+    (_, all_matches), all_time = timed(keyword_scores, responses, [all_keywords] * len(responses), repeats=5)
+
+    base_kw, base_kw_time = timed(baseline_keywords, responses, keyword_lists, repeats=5)
+    base_f1, base_f1_time = timed(lambda: [baseline_f1(p, r) for p, r in pairs])
+    base_rl, base_rl_time = timed(lambda: [baseline_rouge_l(p, r) for p, r in pairs])
+
+    (_, matches), kw_time = timed(keyword_scores, responses, keyword_lists, repeats=5)
+    (_, word_matches), word_time = timed(keyword_scores, responses, keyword_lists, True, repeats=5)
+    f1, f1_time = timed(token_f1_batch, responses, refs)
+    rouge, rl_time = timed(rouge_l_batch, responses, refs)
+    examples = [{"keywords": k, "reference": r} for k, r in zip(keyword_lists, refs)]
+    _, all_metrics_time = timed(score_responses, responses, examples)
+
+    base_matches = [m for _, m in base_kw + base_all]
+    agreement = sum(a == b for a, b in zip(base_matches, matches + all_matches)) / (2 * len(pairs))
+    # Substring hits that are not whole words, e.g. "Section 43" inside "Section 43A"
+    word_agreement = sum(a == b for a, b in zip(base_matches, word_matches)) / len(pairs)
+
+    print("\n" + "=" * 70)
+    print(f"Scoring {len(pairs)} synthetic responses ({num_tokens / len(pairs):.0f} words each)")
+    print("=" * 70)
+    print(f"{'Metric':12s} {'Baseline (s)':>14s} {'Engine (s)':>12s} {'Speedup':>9s}")
+    for name, base, engine in (
+        ("keywords", base_kw_time, kw_time),
+        ("whole words", base_kw_time, word_time),
+        ("token-F1", base_f1_time, f1_time),
+        ("ROUGE-L", base_rl_time, rl_time),
+        ("all three", base_kw_time + base_f1_time + base_rl_time, all_metrics_time),
+        (f"{len(all_keywords)} kw/resp", base_all_time, all_time),
+    ):
+        print(f"{name:12s} {base:14.3f} {engine:12.3f} {base / engine:8.1f}x")
+    print(f"\nToken-F1 identical : {np.allclose(f1, base_f1)}")
+    print(f"ROUGE-L identical  : {np.allclose(rouge, base_rl)}")
+    print(f"Keyword agreement  : {agreement:.1%}")
+    print(f"Whole-word overlap : {word_agreement:.1%} (rest are substring hits inside longer words)")
+
+
+if __name__ == "__main__":
+    main()
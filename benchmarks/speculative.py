@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Decode speed of speculative decoding versus plain generate on long statutory answers
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.inference import CyberSaarthiModel, load_config
+
+
+def load_long_questions(data_file, limit):
+    with open(data_file, "r", encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    # Longest reference answers first: verbatim statutory text is where drafting pays off
+    examples.sort(key=lambda e: len(e["output"]), reverse=True)
+    return [e["instruction"] for e in examples[:limit]]
+
+
+def run(model, questions, max_new_tokens):
+    answers = []
+    new_tokens = 0
+    stats = []
+    start = time.perf_counter()
+    for question in questions:
+        answers.append(model.generate(question, max_new_tokens=max_new_tokens, do_sample=False))
+        if model.last_speculative_stats is not None:
+            stats.append(model.last_speculative_stats)
+            new_tokens += model.last_speculative_stats["new_tokens"]
+        else:
+            prompt = model.format_prompt(question)
+            new_tokens += len(model.tokenizer(prompt + answers[-1])["input_ids"]) - len(model.tokenizer(prompt)["input_ids"])
+    elapsed = time.perf_counter() - start
+    return answers, new_tokens / elapsed, stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the model")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Questions to answer")
+    parser.add_argument("--num-prompts", type=int, default=10, help="Number of questions")
+    parser.add_argument("--max-new-tokens", type=int, default=256, help="Tokens to generate per answer")
+    parser.add_argument("--method", choices=["ngram", "draft_model"], default="ngram")
+    parser.add_argument("--draft-model", default=None, help="Draft model path for --method draft_model")
+    parser.add_argument("--num-draft-tokens", type=int, default=8, help="Tokens proposed per step")
+    args = parser.parse_args()
+
+    config = load_config()
+    speculative_config = dict(
+        config.get("speculative") or {},
+        enabled=True,
+        method=args.method,
+        draft_model=args.draft_model,
+        num_draft_tokens=args.num_draft_tokens,
+        corpus_path=args.data_file,
+    )
+    questions = load_long_questions(args.data_file, args.num_prompts)
+    model = CyberSaarthiModel(args.model_path, cpu_config=config.get("cpu_inference"), speculative_config=speculative_config)
+    drafter = model.drafter
+
+    # Warm up both paths before timing
+    model.generate(questions[0], max_new_tokens=8, do_sample=False)
+    model.drafter = None
+    model.generate(questions[0], max_new_tokens=8, do_sample=False)
+
+    baseline_answers, baseline_tps, _ = run(model, questions, args.max_new_tokens)
+    model.drafter = drafter
+    answers, tps, stats = run(model, questions, args.max_new_tokens)
+
+    draft_tokens = sum(s["draft_tokens"] for s in stats)
+    accepted = sum(s["accepted_tokens"] for s in stats)
+    tokens_per_forward = sum(s["new_tokens"] for s in stats) / sum(s["forward_passes"] for s in stats)
+    matches = sum(a == b for a, b in zip(answers, baseline_answers))
+
+    print("\n" + "=" * 70)
+    print(f"Speculative decoding ({args.method}) on {len(questions)} long answers, greedy")
+    print("=" * 70)
+    print(f"  plain generate      : {baseline_tps:8.1f} tokens/s")
+    print(f"  speculative         : {tps:8.1f} tokens/s ({tps / baseline_tps:.2f}x)")
+    print(f"  acceptance rate     : {accepted / draft_tokens if draft_tokens else 0.0:8.1%}")
+    print(f"  tokens per forward  : {tokens_per_forward:8.2f}")
+    print(f"  identical answers   : {matches}/{len(questions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark suite for CyberSaarthiModel with a regression gate.
+
+`run` loads the model once (a tiny random model unless --model-path is given) and
+measures load time, time-to-first-token and per-token decode latency per prompt-length
+bucket, tokens/sec at several batch sizes, peak RSS, and router/response-cache hit
+rates. Prompt lengths and the cache workload come from data/cyber_laws_qa.jsonl,
+split into short/medium/long buckets at the token-length tertiles. Results are
+written as JSON.
+
+`compare` checks a run against a baseline and exits with status 1 when any metric is
+worse by more than the threshold, or missing from the run without --allow-missing:
+
+    python benchmarks/suite.py run --output benchmark_results/baseline.json
+    python benchmarks/suite.py run --output benchmark_results/current.json
+    python benchmarks/suite.py compare benchmark_results/baseline.json benchmark_results/current.json
+"""
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BUCKETS = ("short", "medium", "long")
+
+# Whether a smaller or a larger value is better, by metric name prefix
+DIRECTIONS = {
+    "load_time_sec": "lower",
+    "peak_rss_mb": "lower",
+    "ttft_ms": "lower",
+    "decode_ms_per_token": "lower",
+    "tokens_per_sec": "higher",
+    "cache_hit_rate": "higher",
+}
+
+
+def metric_direction(name):
+    return DIRECTIONS.get(name.split(".")[0])
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_instructions(data_file):
+    with open(data_file, "r", encoding="utf-8") as f:
+        return [json.loads(line)["instruction"] for line in f if line.strip()]
+
+
+def bucket_instructions(model, instructions):
+    """Split instructions into short/medium/long by prompt token length; returns (buckets, bounds)"""
+    import numpy as np
+
+    lengths = [len(model.tokenizer(model.format_prompt(i))["input_ids"]) for i in instructions]
+    bounds = [int(b) for b in np.percentile(lengths, [100 / 3, 200 / 3])]
+    buckets = {name: [] for name in BUCKETS}
+    for instruction, length in zip(instructions, lengths):
+        name = "short" if length <= bounds[0] else "medium" if length <= bounds[1] else "long"
+        buckets[name].append((length, instruction))
+    return {name: [i for _, i in sorted(rows)] for name, rows in buckets.items()}, bounds
+
+
+def spread(items, n):
+    """n items evenly spaced over the list, so a bucket's whole length range is covered"""
+    if len(items) <= n:
+        return list(items)
+    return [items[round(k * (len(items) - 1) / max(n - 1, 1))] for k in range(n)]
+
+
+def timed_generation(model, instruction, max_new_tokens):
+    """Generate exactly max_new_tokens greedily; returns (ttft_sec, decode gaps in seconds)"""
+    import torch
+    from transformers.generation.streamers import BaseStreamer
+
+    class TimingStreamer(BaseStreamer):
+        # generate() puts the prompt first, then every new token as it is produced
+        def __init__(self):
+            self.times = []
+            self.seen_prompt = False
+
+        def put(self, value):
+            if self.seen_prompt:
+                self.times.append(time.perf_counter())
+            self.seen_prompt = True
+
+        def end(self):
+            pass
+
+    streamer = TimingStreamer()
+    start = time.perf_counter()
+    # Same prefill path as generate(), including the cached preamble
+    inputs = model._prepare_inputs([model.format_prompt(instruction)])
+    with torch.no_grad():
+        model.model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            min_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=model.tokenizer.eos_token_id,
+            streamer=streamer,
+        )
+    times = streamer.times
+    return times[0] - start, [b - a for a, b in zip(times, times[1:])]
+
+
+def measure_latency(model, buckets, prompts_per_bucket, max_new_tokens, repeats):
+    # Each repeat gives a median per bucket; the best repeat is kept, as timeit does,
+    # because on a shared CPU noise only ever makes a run slower
+    metrics, details = {}, {}
+    for name in BUCKETS:
+        prompts = spread(buckets[name], prompts_per_bucket)
+        ttft_runs, decode_runs = [], []
+        for _ in range(repeats):
+            ttfts, gaps = [], []
+            for instruction in prompts:
+                ttft, decode = timed_generation(model, instruction, max_new_tokens)
+                ttfts.append(ttft)
+                gaps.extend(decode)
+            ttft_runs.append(statistics.median(ttfts) * 1000)
+            decode_runs.append(statistics.median(gaps) * 1000 if gaps else None)
+        metrics[f"ttft_ms.{name}"] = min(ttft_runs)
+        metrics[f"decode_ms_per_token.{name}"] = min(decode_runs) if None not in decode_runs else None
+        details[name] = {"prompts": len(prompts), "ttft_ms_runs": ttft_runs, "decode_ms_per_token_runs": decode_runs}
+    return metrics, details
+
+
+def measure_throughput(model, instructions, batch_sizes, num_prompts, max_new_tokens, repeats):
+    # Every prompt has to reach the model, so routing and caching are off for this part
+    saved = model.router, model.response_cache, model.semantic_cache
+    model.router = model.response_cache = model.semantic_cache = None
+    metrics, details = {}, {}
+    try:
+        prompts = spread(instructions, num_prompts)
+        for batch_size in batch_sizes:
+            runs = []
+            for _ in range(repeats):
+                model.generate_batch(prompts, batch_size=batch_size, max_new_tokens=max_new_tokens, do_sample=False)
+                runs.append(model.last_batch_stats)
+            best = max(runs, key=lambda stats: stats["tokens_per_sec"])
+            metrics[f"tokens_per_sec.batch_{batch_size}"] = best["tokens_per_sec"]
+            details[f"batch_{batch_size}"] = {**best, "tokens_per_sec_runs": [r["tokens_per_sec"] for r in runs]}
+    finally:
+        model.router, model.response_cache, model.semantic_cache = saved
+    return metrics, details
+
+
+def measure_cache_hits(model, buckets, cache_config):
+    """Replay each bucket's questions once through the router and fresh caches from config.yaml.
+
+    A miss stores a placeholder answer, so later paraphrases and repeats of it count as
+    hits; hit rates depend only on the caches, not on what the model would answer.
+    """
+    from cyber_saarthi.cache import build_response_cache, build_semantic_cache, make_cache_key
+
+    gen_params = dict(max_new_tokens=256, temperature=1.0, top_p=1.0, top_k=50, repetition_penalty=1.1,
+                      do_sample=False)
+    metrics, details = {}, {}
+    for name in BUCKETS:
+        response_cache = build_response_cache(dict(cache_config, backend="memory"))
+        semantic_cache = build_semantic_cache(cache_config.get("semantic", {}), model)
+        counts = {"router": 0, "exact": 0, "semantic": 0, "miss": 0}
+        for instruction in buckets[name]:
+            if model.route(instruction) is not None:
+                counts["router"] += 1
+                continue
+            key = make_cache_key(instruction, "", gen_params)
+            namespace = make_cache_key("", "", gen_params)
+            if response_cache is not None and response_cache.get(key) is not None:
+                counts["exact"] += 1
+            elif semantic_cache is not None and semantic_cache.get(instruction, namespace) is not None:
+                counts["semantic"] += 1
+            else:
+                counts["miss"] += 1
+                if response_cache is not None:
+                    response_cache.set(key, instruction)
+                if semantic_cache is not None:
+                    semantic_cache.set(instruction, namespace, instruction)
+        total = max(sum(counts.values()), 1)
+        metrics[f"cache_hit_rate.{name}"] = (total - counts["miss"]) / total
+        details[name] = counts
+    return metrics, details
+
+
+def run_suite(args):
+    from cyber_saarthi.inference import load_config, load_model_from_config
+
+    config = load_config()
+    model_path = args.model_path
+    if model_path is None:
+        from cyber_saarthi.tiny_model import create_tiny_model
+
+        model_path = create_tiny_model("./models/tiny-random")
+
+    start = time.perf_counter()
+    model = load_model_from_config(model_path, config, response_cache=None)
+    load_time = time.perf_counter() - start
+    rss_after_load = peak_rss_mb()
+
+    instructions = load_instructions(args.data_file)
+    buckets, bounds = bucket_instructions(model, instructions)
+    # Untimed generations at every prompt length and batch size, so allocator and
+    # kernel warm-up are not counted against whichever measurement happens to run first
+    for name in BUCKETS:
+        timed_generation(model, buckets[name][-1], args.max_new_tokens)
+    model.generate_batch(spread(instructions, max(args.batch_sizes)), batch_size=max(args.batch_sizes),
+                         max_new_tokens=8, do_sample=False)
+
+    metrics = {"load_time_sec": load_time}
+    latency, latency_details = measure_latency(
+        model, buckets, args.prompts_per_bucket, args.max_new_tokens, args.repeats
+    )
+    throughput, throughput_details = measure_throughput(
+        model, instructions, args.batch_sizes, args.throughput_prompts, args.max_new_tokens, args.repeats
+    )
+    hits, hit_details = measure_cache_hits(model, buckets, config.get("cache", {}))
+    metrics.update(latency)
+    metrics.update(throughput)
+    metrics.update(hits)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+
+    import torch
+
+    return {
+        "meta": {
+            "model_path": model_path,
+            "data_file": args.data_file,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "max_new_tokens": args.max_new_tokens,
+            "repeats": args.repeats,
+            "bucket_bounds_tokens": bounds,
+            "bucket_sizes": {name: len(buckets[name]) for name in BUCKETS},
+        },
+        "metrics": metrics,
+        "details": {
+            "load": {**model.load_metrics, "rss_after_load_mb": rss_after_load},
+            "latency": latency_details,
+            "throughput": throughput_details,
+            "cache_hits": hit_details,
+        },
+    }
+
+
+def print_results(results):
+    meta = results["meta"]
+    print("\n" + "=" * 70)
+    print(f"Benchmark of {meta['model_path']} ({meta['threads']} threads, torch {meta['torch']})")
+    print(f"Prompt buckets (tokens): short <= {meta['bucket_bounds_tokens'][0]} < medium "
+          f"<= {meta['bucket_bounds_tokens'][1]} < long")
+    print("=" * 70)
+    for name, value in results["metrics"].items():
+        print(f"  {name:32s} {'-' if value is None else f'{value:.3f}':>12s}")
+
+
+def compare(baseline, current, threshold, overrides=None, allow_missing=()):
+    """Rows of (metric, baseline, current, relative change, status).
+
+    status is ok/regression/improved/missing/skipped. overrides maps a metric name or
+    prefix (e.g. "tokens_per_sec") to its own threshold. A baseline metric absent from
+    the current run is "missing", which fails the gate, unless its name or prefix is in
+    allow_missing.
+    """
+    overrides = overrides or {}
+    rows = []
+    for name, base in baseline["metrics"].items():
+        limit = overrides.get(name, overrides.get(name.split(".")[0], threshold))
+        value = current["metrics"].get(name)
+        direction = metric_direction(name)
+        if value is None and base is not None:
+            allowed = name in allow_missing or name.split(".")[0] in allow_missing
+            rows.append((name, base, value, None, "skipped" if allowed else "missing"))
+            continue
+        if base is None or direction is None:
+            rows.append((name, base, value, None, "skipped"))
+            continue
+        if base == 0:
+            change = 0.0 if value == 0 else float("inf")
+        else:
+            change = (value - base) / abs(base)
+        worse = change if direction == "lower" else -change
+        if worse > limit:
+            status = "regression"
+        elif worse < -limit:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, base, value, change, status))
+    return rows
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inference benchmark suite with a regression gate")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmarks and write JSON results")
+    run.add_argument("--model-path", default=None, help="Model to benchmark (default: tiny random model)")
+    run.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Prompt source")
+    run.add_argument("--output", default="./benchmark_results/latest.json", help="Where to write the results")
+    run.add_argument("--max-new-tokens", type=int, default=32, help="Tokens generated per prompt")
+    run.add_argument("--prompts-per-bucket", type=int, default=4, help="Latency prompts per length bucket")
+    run.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16], help="Throughput batch sizes")
+    run.add_argument("--throughput-prompts", type=int, default=16, help="Prompts per throughput run")
+    run.add_argument("--repeats", type=int, default=3, help="Runs per measurement; the best one is reported")
+
+    check = commands.add_parser("compare", help="Fail if a run regressed against a baseline")
+    check.add_argument("baseline", help="Baseline results JSON")
+    check.add_argument("current", help="Results JSON to check")
+    check.add_argument("--threshold", type=float, default=0.10, help="Allowed relative change (0.10 = 10%%)")
+    check.add_argument("--metric-threshold", action="append", default=[], metavar="METRIC=VALUE",
+                       help="Threshold for one metric or prefix, e.g. tokens_per_sec=0.2 (repeatable)")
+    check.add_argument("--allow-missing", action="append", default=[], metavar="METRIC",
+                       help="Metric or prefix that may be absent from the current run (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args)
+        print_results(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    for field in ("model_path", "torch", "threads", "max_new_tokens"):
+        if baseline["meta"].get(field) != current["meta"].get(field):
+            print(f"Warning: {field} differs ({baseline['meta'].get(field)} vs {current['meta'].get(field)})")
+
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    overrides = {}
+    for item in args.metric_threshold:
+        name, _, value = item.partition("=")
+        overrides[name] = float(value)
+    rows = compare(baseline, current, args.threshold, overrides, set(args.allow_missing))
+    print(f"\n{'Metric':32s} {'Baseline':>12s} {'Current':>12s} {'Change':>9s}  Status")
+    for name, base, value, change, status in rows:
+        shown = "-" if change is None else f"{change:+.1%}"
+        print(f"{name:32s} {fmt(base):>12s} {fmt(value):>12s} {shown:>9s}  {status}")
+
+    regressions = [row[0] for row in rows if row[4] == "regression"]
+    missing = [row[0] for row in rows if row[4] == "missing"]
+    if regressions:
+        print(f"\n✗ {len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+    if missing:
+        print(f"\n✗ {len(missing)} metric(s) missing from the current run: {', '.join(missing)}")
+    if regressions or missing:
+        sys.exit(1)
+    print(f"\n✓ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
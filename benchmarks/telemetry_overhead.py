@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Cost of per-request telemetry on generate(): disabled (the default), enabled without
+logging, and enabled with one JSON log line per call
+"""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.inference import CyberSaarthiModel
+from cyber_saarthi.telemetry import Telemetry
+
+MODES = {
+    "disabled": {},
+    "enabled": {"enabled": True, "log": False},
+    "enabled+log": {"enabled": True, "log_path": os.devnull},
+}
+
+# Answered by the corpus router, so only the telemetry around the model is measured
+ROUTED_QUERY = "What is Section 66 of the IT Act?"
+MODEL_QUERY = "How do I report a cybercrime?"
+
+
+def time_calls(model, query, repeats, max_new_tokens):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.generate(query, max_new_tokens=max_new_tokens, do_sample=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure telemetry overhead on generate()")
+    parser.add_argument("--model-path", default=None, help="Model to benchmark (default: tiny random model)")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="Tokens per generation")
+    parser.add_argument("--routed-calls", type=int, default=20000, help="Router-answered calls per mode")
+    parser.add_argument("--model-calls", type=int, default=30, help="Model generations per mode")
+    args = parser.parse_args()
+
+    model_path = args.model_path
+    if model_path is None:
+        from cyber_saarthi.tiny_model import create_tiny_model
+
+        model_path = create_tiny_model("./models/tiny-random")
+    model = CyberSaarthiModel(model_path, router_config={"enabled": True})
+    time_calls(model, MODEL_QUERY, 3, args.max_new_tokens)
+
+    results = {}
+    for mode, settings in MODES.items():
+        model.telemetry = Telemetry(**settings)
+        results[mode] = (
+            time_calls(model, ROUTED_QUERY, args.routed_calls, args.max_new_tokens),
+            time_calls(model, MODEL_QUERY, args.model_calls, args.max_new_tokens),
+        )
+
+    print("\n" + "=" * 70)
+    print(f"{'Mode':14s} {'Routed call (us)':>17s} {'Generate (ms)':>15s} {'Overhead':>10s}")
+    print("=" * 70)
+    base = results["disabled"][1]
+    for mode, (routed, generated) in results.items():
+        print(f"{mode:14s} {routed * 1e6:17.2f} {generated * 1000:15.2f} {(generated - base) / base:+10.1%}")
+
+
+if __name__ == "__main__":
+    main()
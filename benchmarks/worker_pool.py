@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Aggregate throughput of the multi-process worker pool versus a single process using every core
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cyber_saarthi.inference import load_config
+from cyber_saarthi.worker_pool import WorkerPool, available_cores
+
+
+def load_instructions(data_file, limit):
+    with open(data_file, "r", encoding="utf-8") as f:
+        return [json.loads(line)["instruction"] for line in f if line.strip()][:limit]
+
+
+def run(model_path, num_workers, instructions, max_new_tokens, max_batch_size, cpu_config):
+    # No response cache: every request must reach a worker
+    pool = WorkerPool(model_path, num_workers=num_workers, cpu_config=cpu_config, max_batch_size=max_batch_size)
+    try:
+        pool.wait_until_ready()
+        # One untimed round so every worker has allocated its buffers
+        pool.generate_batch(instructions[:pool.num_workers], max_new_tokens=4, do_sample=False)
+        tokens_before = pool.generated_tokens
+
+        start = time.perf_counter()
+        pool.generate_batch(instructions, max_new_tokens=max_new_tokens, do_sample=False)
+        elapsed = time.perf_counter() - start
+        tokens = pool.generated_tokens - tokens_before
+        return {
+            "workers": pool.num_workers,
+            "cores_per_worker": len(pool.core_groups[0]),
+            "elapsed_sec": elapsed,
+            "requests_per_sec": len(instructions) / elapsed,
+            "tokens_per_sec": tokens / elapsed,
+        }
+    finally:
+        pool.shutdown()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the CPU worker pool against a single process")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the model")
+    parser.add_argument("--data-file", default="./data/cyber_laws_qa.jsonl", help="Instructions to send")
+    parser.add_argument("--num-prompts", type=int, default=64, help="Number of requests")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens to generate per request")
+    parser.add_argument("--max-batch-size", type=int, default=4, help="Batch size inside each worker")
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Pool sizes to compare (default: 1 and one per 4 cores)")
+    args = parser.parse_args()
+
+    instructions = load_instructions(args.data_file, args.num_prompts)
+    cpu_config = load_config().get("cpu_inference")
+    worker_counts = args.workers or sorted({1, max(1, len(available_cores()) // 4)})
+
+    results = [
+        run(args.model_path, n, instructions, args.max_new_tokens, args.max_batch_size, cpu_config)
+        for n in worker_counts
+    ]
+
+    print("\n" + "=" * 70)
+    print(f"{len(instructions)} requests x {args.max_new_tokens} new tokens on {len(available_cores())} cores")
+    print("=" * 70)
+    print(f"{'Workers':>8s} {'Cores/worker':>13s} {'Time (s)':>10s} {'req/s':>8s} {'tokens/s':>10s} {'Speedup':>8s}")
+    baseline = results[0]["tokens_per_sec"]
+    for r in results:
+        print(f"{r['workers']:8d} {r['cores_per_worker']:13d} {r['elapsed_sec']:10.2f} "
+              f"{r['requests_per_sec']:8.2f} {r['tokens_per_sec']:10.1f} {r['tokens_per_sec'] / baseline:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
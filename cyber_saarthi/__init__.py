@@ -1,2 +1,10 @@
 # Cyber Saarthi Package
 __version__ = "1.0.0"
+
+
+def __getattr__(name):
+    # Resolved on first access so `import cyber_saarthi` stays cheap
+    if name == "CyberSaarthiModel":
+        from cyber_saarthi.inference import CyberSaarthiModel
+        return CyberSaarthiModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
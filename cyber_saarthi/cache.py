@@ -0,0 +1,356 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Sampling knobs only change the output when do_sample is on
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k")
+
+
+def normalize_instruction(text):
+    """Fold case, unicode forms, whitespace and trailing punctuation"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def make_cache_key(instruction, input_text, gen_params):
+    params = dict(gen_params)
+    if not params.get("do_sample", False):
+        for name in SAMPLING_PARAMS:
+            params.pop(name, None)
+    payload = json.dumps(
+        {
+            "instruction": normalize_instruction(instruction),
+            "input": normalize_instruction(input_text),
+            "params": params,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU cache of generated responses with optional TTL"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=None, allow_sampled=False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.allow_sampled = allow_sampled
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at):
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, response):
+        with self._lock:
+            self._entries[key] = (response, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk variant of ResponseCache that survives restarts"""
+
+    def __init__(self, path, max_entries=1024, ttl_seconds=None, allow_sampled=False):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds, allow_sampled=allow_sampled)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared between Streamlit sessions and the scheduler thread, guarded by self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def build_response_cache(cache_config):
+    """Create the cache described by the `cache` section of config.yaml, or None"""
+    if not cache_config or not cache_config.get("enabled", False):
+        return None
+
+    kwargs = {
+        "max_entries": cache_config.get("max_entries", 1024),
+        "ttl_seconds": cache_config.get("ttl_seconds"),
+        "allow_sampled": cache_config.get("cache_sampled", False),
+    }
+    if cache_config.get("backend", "memory") == "sqlite":
+        return SQLiteResponseCache(cache_config.get("sqlite_path", "./models/response_cache.sqlite"), **kwargs)
+    return ResponseCache(**kwargs)
+
+
+SECTION_PATTERN = re.compile(r"\bsection\s+(\d+[a-z]?)\b")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def section_ids(text):
+    """Section identifiers mentioned in a query, e.g. {"66c", "43a"}"""
+    return frozenset(SECTION_PATTERN.findall(normalize_instruction(text)))
+
+
+class TfidfEmbedder:
+    """Lightweight TF-IDF query embedder fitted on the dataset instructions.
+
+    When `groups` is given (the answer each instruction maps to), document frequency is
+    counted per answer group instead of per instruction. The dataset phrases every topic
+    with the same templates ("Tell me about", "Explain", ...), so template words land in
+    nearly every group and get an IDF near zero while topic words dominate similarity.
+    """
+
+    def __init__(self, documents, groups=None):
+        if groups is None:
+            groups = range(len(documents))
+        group_tokens = {}
+        for doc, group in zip(documents, groups):
+            group_tokens.setdefault(group, set()).update(WORD_PATTERN.findall(normalize_instruction(doc)))
+
+        doc_freq = {}
+        for tokens in group_tokens.values():
+            for token in tokens:
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+
+        n_groups = len(group_tokens)
+        self.vocab = {token: i for i, token in enumerate(sorted(doc_freq))}
+        self.idf = np.array(
+            [np.log((1 + n_groups) / (1 + doc_freq[token])) for token in sorted(doc_freq)], dtype=np.float32
+        )
+        # Words never seen in training still count against similarity
+        self.oov_idf = float(np.log(1 + n_groups))
+        self.dim = len(self.vocab)
+
+    @classmethod
+    def from_jsonl(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return cls([row["instruction"] for row in rows], groups=[row["output"] for row in rows])
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        oov_mass = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for token in WORD_PATTERN.findall(normalize_instruction(text)):
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                weight = 1 + np.log(count)
+                if token in self.vocab:
+                    col = self.vocab[token]
+                    vectors[row, col] = weight * self.idf[col]
+                else:
+                    oov_mass[row] += (weight * self.oov_idf) ** 2
+        norms = np.sqrt((vectors ** 2).sum(axis=1) + oov_mass)
+        return vectors / np.maximum(norms, 1e-12)[:, None]
+
+
+class ModelEmbedder:
+    """Mean-pooled last hidden states of the loaded CyberSaarthiModel"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed(self, texts):
+        import torch
+
+        self.model.wait_until_loaded()
+        tokenizer = self.model.tokenizer
+        inputs = tokenizer(
+            [normalize_instruction(t) for t in texts], return_tensors="pt", padding=True, truncation=True, max_length=128
+        )
+        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        with torch.no_grad():
+            hidden = self.model.model(**inputs, output_hidden_states=True).hidden_states[-1]
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        pooled = torch.nn.functional.normalize(pooled.float(), dim=-1)
+        return pooled.cpu().numpy()
+
+
+class SemanticResponseCache:
+    """Returns a stored answer when a new query is a close paraphrase of an earlier one.
+
+    Entries are kept per namespace (input text + generation params) in a dense NumPy
+    matrix of unit vectors, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, embedder, threshold=0.85, max_entries=4096, allow_sampled=False):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.allow_sampled = allow_sampled
+        self.hits = 0
+        self.misses = 0
+        self._indexes = {}
+        self._recent_vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        key = normalize_instruction(text)
+        vector = self._recent_vectors.get(key)
+        if vector is None:
+            vector = self.embedder.embed([text])[0]
+            self._recent_vectors[key] = vector
+            if len(self._recent_vectors) > 256:
+                self._recent_vectors.popitem(last=False)
+        return vector
+
+    def get(self, instruction, namespace):
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None or index["size"] == 0:
+                self.misses += 1
+                return None
+
+            size = index["size"]
+            scores = index["vectors"][:size] @ self._vector(instruction)
+            # Never answer "Section 66C" with a cached "Section 66D"
+            sections = section_ids(instruction)
+            mismatched = np.fromiter((s != sections for s in index["sections"]), dtype=bool, count=size)
+            scores[mismatched] = -1.0
+
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return index["responses"][best]
+
+    def set(self, instruction, namespace, response):
+        with self._lock:
+            vector = self._vector(instruction)
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = {
+                    "vectors": np.zeros((16, vector.shape[0]), dtype=np.float32),
+                    "sections": [],
+                    "responses": [],
+                    "size": 0,
+                }
+                self._indexes[namespace] = index
+
+            if index["size"] >= self.max_entries:
+                # Drop the oldest entry once full
+                index["vectors"][:-1] = index["vectors"][1:].copy()
+                index["sections"].pop(0)
+                index["responses"].pop(0)
+                index["size"] -= 1
+            elif index["size"] == index["vectors"].shape[0]:
+                grown = np.zeros((min(2 * index["size"], self.max_entries), vector.shape[0]), dtype=np.float32)
+                grown[:index["size"]] = index["vectors"]
+                index["vectors"] = grown
+
+            index["vectors"][index["size"]] = vector
+            index["sections"].append(section_ids(instruction))
+            index["responses"].append(response)
+            index["size"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def __len__(self):
+        return sum(index["size"] for index in self._indexes.values())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+
+def build_semantic_cache(semantic_config, model=None):
+    """Create the cache described by `cache.semantic` in config.yaml, or None"""
+    if not semantic_config or not semantic_config.get("enabled", False):
+        return None
+
+    if semantic_config.get("embedder", "tfidf") == "model":
+        embedder = ModelEmbedder(model)
+    else:
+        embedder = TfidfEmbedder.from_jsonl(semantic_config.get("corpus_path", "./data/cyber_laws_qa.jsonl"))
+    return SemanticResponseCache(
+        embedder,
+        threshold=semantic_config.get("threshold", 0.85),
+        max_entries=semantic_config.get("max_entries", 4096),
+        allow_sampled=semantic_config.get("cache_sampled", False),
+    )
@@ -1,16 +1,17 @@
 import streamlit as st
+import importlib.util
 import os
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-try:
-    from cyber_saarthi.inference import CyberSaarthiModel
-    INFERENCE_AVAILABLE = True
-except ImportError as e:
-    INFERENCE_AVAILABLE = False
-    IMPORT_ERROR = str(e)
+from cyber_saarthi.inference import EXAMPLE_QUERIES, load_config, load_model_from_config
+
+# Only check that the ML stack is installed; importing it here would delay the first paint by seconds
+MISSING_DEPENDENCIES = [name for name in ("torch", "transformers", "peft") if importlib.util.find_spec(name) is None]
+INFERENCE_AVAILABLE = not MISSING_DEPENDENCIES
+IMPORT_ERROR = f"No module named {', '.join(MISSING_DEPENDENCIES)}"
 
 
 st.set_page_config(
@@ -70,20 +71,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-EXAMPLE_QUERIES = [
-    "What is Section 66C of the IT Act?",
-    "What are the penalties for hacking in India?",
-    "How do I report a cybercrime?",
-    "Explain Section 43A about data protection",
-    "What is identity theft under Indian cyber law?",
-    "What is cyber terrorism according to Indian law?",
-    "What are the privacy laws in India?",
-    "What is CERT-In and what does it do?",
-    "What are cybersecurity best practices for individuals?",
-    "Can the government intercept online communications?",
-]
-
-
 @st.cache_resource
 def load_model(model_path):
     if not INFERENCE_AVAILABLE:
@@ -110,12 +97,32 @@ def load_model(model_path):
         return None, error_msg
     
     try:
-        model = CyberSaarthiModel(model_path)
+        config = load_config()
+        serving_config = config.get("serving", {})
+        # Loading and warm-up run in a background thread so the page renders immediately
+        model = load_model_from_config(
+            model_path,
+            config,
+            warmup=serving_config.get("warmup", True),
+            background=serving_config.get("background_load", True),
+        )
         return model, None
     except Exception as e:
         return None, f"Error loading model: {str(e)}"
 
 
+@st.cache_resource
+def load_scheduler(_model):
+    from cyber_saarthi.scheduler import ContinuousBatchingScheduler
+    
+    # One scheduler per process so concurrent sessions share the running batch
+    serving_config = load_config().get("serving", {})
+    return ContinuousBatchingScheduler(
+        _model,
+        max_batch_size=serving_config.get("max_batch_size", 8),
+    )
+
+
 def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -141,6 +148,25 @@ def display_chat_history():
             """, unsafe_allow_html=True)
 
 
+def stream_response(query, max_new_tokens, temperature, top_p):
+    st.markdown(f"""
+    <div class="chat-message user-message">
+        <strong>👤 You:</strong><br/>
+        {query}
+    </div>
+    """, unsafe_allow_html=True)
+    st.markdown("<strong>🛡️ Cyber Saarthi:</strong>", unsafe_allow_html=True)
+    
+    response = st.write_stream(st.session_state.scheduler.stream(
+        instruction=query,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+    ))
+    
+    st.session_state.messages.append({"role": "assistant", "content": response.strip()})
+
+
 def main():
     """Main application"""
     initialize_session_state()
@@ -202,8 +228,8 @@ def main():
                     model, error = load_model(model_path)
                     if model:
                         st.session_state.model = model
+                        st.session_state.scheduler = load_scheduler(model)
                         st.session_state.model_loaded = True
-                        st.success("✅ Model loaded successfully!")
                     else:
                         st.error(f"❌ Error loading model: {error}")
                         st.stop()
@@ -220,24 +246,28 @@ def main():
                     """)
                     st.stop()
         
+        health = st.session_state.model.health()
+        if health["error"]:
+            st.error(f"❌ Error loading model: {health['error']}")
+            st.stop()
+        if health["ready"]:
+            st.caption(f"🟢 Model ready (loaded in {health['load_time_sec']:.1f}s)")
+        else:
+            st.info("⏳ Cyber Saarthi is warming up. You can ask now; the answer starts as soon as the model is ready.")
+        
         display_chat_history()
         
+        # Answers stream here, even when triggered from the example buttons in col2
+        response_area = st.container()
+        
         user_input = st.chat_input("Ask me about Indian cyber laws...")
         
         if user_input:
             st.session_state.messages.append({"role": "user", "content": user_input})
             
-            with st.spinner("Thinking..."):
+            with response_area:
                 try:
-                    response = st.session_state.model.generate(
-                        instruction=user_input,
-                        max_new_tokens=max_new_tokens,
-                        temperature=temperature,
-                        top_p=top_p,
-                    )
-                    
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    
+                    stream_response(user_input, max_new_tokens, temperature, top_p)
                 except Exception as e:
                     st.error(f"Error generating response: {e}")
             
@@ -251,17 +281,9 @@ def main():
             if st.button(query, key=f"example_{i}", use_container_width=True):
                 st.session_state.messages.append({"role": "user", "content": query})
                 
-                with st.spinner("Thinking..."):
+                with response_area:
                     try:
-                        response = st.session_state.model.generate(
-                            instruction=query,
-                            max_new_tokens=max_new_tokens,
-                            temperature=temperature,
-                            top_p=top_p,
-                        )
-                        
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        
+                        stream_response(query, max_new_tokens, temperature, top_p)
                     except Exception as e:
                         st.error(f"Error: {e}")
                 
@@ -0,0 +1,242 @@
+"""
+Batched evaluation of a checkpoint on a held-out JSONL file.
+
+Answers are generated greedily in batches and scored by how many of the expected
+keywords they contain, plus token-F1 and ROUGE-L against the reference output (see
+cyber_saarthi.scoring). Rows may list "expected_keywords"; otherwise the keywords
+are taken from the reference output (section numbers, penalties, legal terms).
+Responses are cached per checkpoint hash, so re-running on an unchanged model only
+re-scores, and a model is loaded only when something is missing from the cache.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+
+from cyber_saarthi.cache import SQLiteResponseCache, make_cache_key, section_ids
+from cyber_saarthi.scoring import aggregate, keyword_scores, score_responses
+
+SECTION_REF_PATTERN = re.compile(r"\bSection \d+[A-Z]?\b")
+PENALTY_PATTERN = re.compile(
+    r"\b(?:one|two|three|five|seven|ten|\d+) (?:years?|lakh|crore)\b", re.IGNORECASE
+)
+# Legal terms worth checking for whenever the reference answer uses them
+DOMAIN_TERMS = (
+    "identity theft", "cheating by personation", "electronic signature", "password", "imprisonment",
+    "life imprisonment", "fine", "damages", "compensation", "body corporate", "sensitive personal data",
+    "reasonable security", "computer resource", "unauthorized access", "intermediary", "due diligence",
+    "obscene", "sexually explicit", "child", "privacy", "interception", "decryption", "protected system",
+    "critical information infrastructure", "cyber terrorism", "sovereignty", "integrity", "cert-in",
+    "adjudicating officer", "phishing", "hacking", "data protection", "encryption", "virus",
+)
+
+
+def extract_keywords(reference):
+    """Keywords an answer to the same question should mention, in order of appearance"""
+    found = SECTION_REF_PATTERN.findall(reference) + PENALTY_PATTERN.findall(reference)
+    lower = reference.lower()
+    found += [term for term in DOMAIN_TERMS if re.search(rf"\b{re.escape(term)}\b", lower)]
+    keywords = []
+    for keyword in found:
+        if keyword.lower() not in (k.lower() for k in keywords):
+            keywords.append(keyword)
+    return keywords
+
+
+def keyword_score(response, keywords, whole_words=False):
+    """Percentage of keywords found in the response, and the ones that were"""
+    scores, matches = keyword_scores([response], [keywords], whole_words)
+    return scores[0], matches[0]
+
+
+def example_category(instruction):
+    lower = instruction.lower()
+    if "difference" in lower or " vs " in lower or "compare" in lower:
+        return "Comparison"
+    if any(word in lower for word in ("penalt", "punishment", "consequence")):
+        return "Penalties"
+    if section_ids(instruction):
+        return "Specific Section"
+    return "General"
+
+
+def load_examples(path):
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            reference = row.get("output", "")
+            examples.append({
+                "instruction": row["instruction"],
+                "input": row.get("input", ""),
+                "reference": reference,
+                "keywords": row.get("expected_keywords") or extract_keywords(reference),
+                "category": row.get("category") or example_category(row["instruction"]),
+            })
+    return examples
+
+
+def checkpoint_hash(model_path, cpu_config=None):
+    """Content hash of the checkpoint files plus the settings that change its outputs"""
+    from cyber_saarthi.inference import find_merged_model
+
+    digest = hashlib.sha256()
+    # An up-to-date merged export is what actually gets loaded, so its weights count too
+    for directory in filter(None, (model_path, find_merged_model(model_path))):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            digest.update(os.path.relpath(path, model_path).encode("utf-8"))
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    cpu_config = cpu_config or {}
+    settings = {name: cpu_config.get(name) for name in ("dtype", "int8_dynamic_quantization")}
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def run_evaluation(model_path, examples, cache_dir="./models/eval_cache", max_new_tokens=256, batch_size=8,
+                   cpu_config=None, model=None, whole_words=False):
+    """Score every example; returns (results, summary)"""
+    start = time.perf_counter()
+    model_hash = checkpoint_hash(model_path, cpu_config)
+    # Deterministic decoding, so a cached answer is the answer this checkpoint gives
+    gen_params = dict(
+        max_new_tokens=max_new_tokens, temperature=1.0, top_p=1.0, top_k=50, repetition_penalty=1.1, do_sample=False
+    )
+    cache = None
+    if cache_dir:
+        cache = SQLiteResponseCache(
+            os.path.join(cache_dir, f"{model_hash[:16]}.sqlite"), max_entries=max(len(examples), 1024)
+        )
+
+    keys = [make_cache_key(e["instruction"], e["input"], gen_params) for e in examples]
+    responses = [cache.get(key) if cache is not None else None for key in keys]
+    missing = [i for i, response in enumerate(responses) if response is None]
+
+    generation_stats = None
+    if missing:
+        if model is None:
+            from cyber_saarthi.inference import CyberSaarthiModel
+
+            model = CyberSaarthiModel(model_path, cpu_config=cpu_config)
+        generated = model.generate_batch(
+            [examples[i]["instruction"] for i in missing],
+            input_texts=[examples[i]["input"] for i in missing],
+            batch_size=batch_size,
+            **gen_params,
+        )
+        generation_stats = model.last_batch_stats
+        for i, response in zip(missing, generated):
+            responses[i] = response
+            if cache is not None:
+                cache.set(keys[i], response)
+
+    results = [
+        {"instruction": example["instruction"], "category": example["category"], **scores, "response": response}
+        for example, response, scores in zip(examples, responses, score_responses(responses, examples, whole_words))
+    ]
+    aggregates = aggregate(results)
+    summary = {
+        "model_path": model_path,
+        "checkpoint_hash": model_hash,
+        "num_examples": len(results),
+        "num_scored": sum(r["keyword_score"] is not None for r in results),
+        "whole_words": whole_words,
+        **aggregates["overall"],
+        "by_category": aggregates["by_category"],
+        "cached": len(examples) - len(missing),
+        "generated": len(missing),
+        "generation_stats": generation_stats,
+        "max_new_tokens": max_new_tokens,
+        "elapsed_sec": time.perf_counter() - start,
+    }
+    return results, summary
+
+
+def write_reports(results, summary, output_dir):
+    """Write eval-<hash>.json (summary and results) and eval-<hash>.csv (one row per example)"""
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(output_dir, f"eval-{summary['checkpoint_hash'][:12]}")
+    with open(f"{stem}.json", "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "results": results}, f, indent=2, ensure_ascii=False)
+    with open(f"{stem}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "instruction", "category", "keyword_score", "token_f1", "rouge_l", "matched", "missing", "response"
+        ])
+        for r in results:
+            writer.writerow([
+                r["instruction"], r["category"],
+                *("" if r[metric] is None else f"{r[metric]:.1f}" for metric in ("keyword_score", "token_f1", "rouge_l")),
+                "; ".join(r["matched"]), "; ".join(r["missing"]), r["response"],
+            ])
+    return f"{stem}.json", f"{stem}.csv"
+
+
+def print_summary(summary):
+    print("\n" + "=" * 70)
+    print(f"Evaluation of {summary['model_path']} ({summary['checkpoint_hash'][:12]})")
+    print("=" * 70)
+    print(f"  examples          : {summary['num_examples']} ({summary['num_scored']} with keywords)")
+    print(f"  from cache        : {summary['cached']}, generated: {summary['generated']}")
+    stats = summary["generation_stats"]
+    if stats:
+        print(f"  generation        : {stats['new_tokens']} tokens in {stats['elapsed_sec']:.1f}s "
+              f"({stats['tokens_per_sec']:.1f} tokens/sec)")
+    print(f"  elapsed           : {summary['elapsed_sec']:.1f}s")
+
+    def fmt(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9s}"
+
+    print(f"\n  {'Category':20s} {'Count':>6s} {'Keywords':>9s} {'Token-F1':>9s} {'ROUGE-L':>9s}")
+    rows = list(summary["by_category"].items()) + [("Overall", summary)]
+    for name, row in rows:
+        print(f"  {name:20s} {row['count']:6d} {fmt(row['keyword_score'])} {fmt(row['token_f1'])} {fmt(row['rouge_l'])}")
+
+
+def main():
+    import argparse
+
+    from cyber_saarthi.inference import load_config
+
+    parser = argparse.ArgumentParser(description="Evaluate a Cyber Saarthi checkpoint on a held-out set")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Checkpoint to evaluate")
+    parser.add_argument("--data-file", default="./data/validation.jsonl", help="Held-out JSONL file")
+    parser.add_argument("--output-dir", default="./eval_results", help="Where to write the JSON/CSV reports")
+    parser.add_argument("--cache-dir", default="./models/eval_cache", help="Per-checkpoint response cache")
+    parser.add_argument("--no-cache", action="store_true", help="Regenerate every answer")
+    parser.add_argument("--max-new-tokens", type=int, default=256, help="Tokens to generate per answer")
+    parser.add_argument("--batch-size", type=int, default=8, help="Prompts per generate call")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N examples")
+    parser.add_argument("--whole-words", action="store_true", help="Only count keywords that appear as whole words")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data_file):
+        print(f"Error: Evaluation data not found at {args.data_file}")
+        print("Generate the train/validation split first using: python -m cyber_saarthi.dataset_generator")
+        return
+
+    examples = load_examples(args.data_file)[:args.limit]
+    results, summary = run_evaluation(
+        args.model_path,
+        examples,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        max_new_tokens=args.max_new_tokens,
+        batch_size=args.batch_size,
+        cpu_config=load_config().get("cpu_inference"),
+        whole_words=args.whole_words,
+    )
+    print_summary(summary)
+    json_path, csv_path = write_reports(results, summary, args.output_dir)
+    print(f"\n✓ Reports written to {json_path} and {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
+import hashlib
+import json
 import os
+import shutil
+import time
 import yaml
 import torch
 from datasets import load_dataset
@@ -8,6 +12,7 @@ from transformers import (
     BitsAndBytesConfig,
     TrainingArguments,
     Trainer,
+    TrainerCallback,
     DataCollatorForLanguageModeling
 )
 from peft import (
@@ -40,7 +45,8 @@ def format_instruction(example):
 
 {example["output"]}"""
     
-    return {"text": prompt}
+    # Character offset where the answer starts, for completion-only loss
+    return {"text": prompt, "response_offset": len(prompt) - len(example["output"])}
 
 
 def prepare_dataset(config):
@@ -53,7 +59,11 @@ def prepare_dataset(config):
         'validation': val_file
     })
     
-    dataset = dataset.map(format_instruction, remove_columns=["instruction", "input", "output"])
+    # The tokenized-dataset cache already covers this step. The datasets map cache
+    # fingerprints format_instruction by name, so it would serve stale results after edits
+    dataset = dataset.map(
+        format_instruction, remove_columns=["instruction", "input", "output"], load_from_cache_file=False
+    )
     
     print(f"Training examples: {len(dataset['train'])}")
     print(f"Validation examples: {len(dataset['validation'])}")
@@ -102,26 +112,297 @@ def setup_model_and_tokenizer(config):
 
 
 def tokenize_function(examples, tokenizer, max_length=2048):
-    return tokenizer(
+    tokenized = tokenizer(
         examples["text"],
         truncation=True,
         max_length=max_length,
         padding=False,  # Use dynamic padding via data collator
+        return_length=True,  # "length" feeds the length-grouped sampler
+        return_offsets_mapping=tokenizer.is_fast,
     )
+    # Index of the first answer token; with truncation it can be the sequence length
+    if tokenizer.is_fast:
+        tokenized["response_start"] = [
+            next((i for i, (start, end) in enumerate(offsets) if end > max(start, chars)), len(offsets))
+            for offsets, chars in zip(tokenized.pop("offset_mapping"), examples["response_offset"])
+        ]
+    else:
+        tokenized["response_start"] = [
+            min(len(tokenizer(text[:chars])["input_ids"]), length)
+            for text, chars, length in zip(examples["text"], examples["response_offset"], tokenized["length"])
+        ]
+    return tokenized
+
+
+# Bump when format_instruction or tokenize_function change what gets cached
+TOKENIZED_CACHE_VERSION = 2
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tokenizer_sha256(tokenizer):
+    """Hash of what the tokenizer does, independent of where it was loaded from"""
+    if getattr(tokenizer, "is_fast", False):
+        state = tokenizer.backend_tokenizer.to_str()
+    else:
+        state = json.dumps(sorted(tokenizer.get_vocab().items()))
+    special = json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str)
+    return hashlib.sha256((state + special).encode("utf-8")).hexdigest()
+
+
+def tokenized_cache_key(config, tokenizer):
+    dataset_config = config["dataset"]
+    files = [
+        os.path.join(dataset_config["data_dir"], dataset_config[name])
+        for name in ("train_file", "validation_file")
+    ]
+    payload = json.dumps({
+        "version": TOKENIZED_CACHE_VERSION,
+        "files": [file_sha256(path) for path in files],
+        "tokenizer": tokenizer_sha256(tokenizer),
+        "max_length": config["model"]["max_length"],
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_tokenized_dataset(config, tokenizer):
+    """Tokenized train/validation splits, from the on-disk cache when nothing changed.
+
+    The cache holds the full splits as Arrow files, which load_from_disk memory-maps,
+    so later runs skip the JSON load and both map passes. dataset.max_samples is
+    applied afterwards, so a --test-mode run fills the cache for full runs too.
+    """
+    from datasets import load_from_disk
+
+    max_length = config["model"]["max_length"]
+    cache_dir = config["dataset"].get("cache_dir")
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"tokenized-{tokenized_cache_key(config, tokenizer)}")
+
+    if cache_path and os.path.isdir(cache_path):
+        tokenized_dataset = load_from_disk(cache_path)
+        print(f"Loaded tokenized dataset from {cache_path}")
+    else:
+        dataset = prepare_dataset(config)
+        tokenized_dataset = dataset.map(
+            lambda x: tokenize_function(x, tokenizer, max_length),
+            batched=True,
+            remove_columns=["text", "response_offset"],
+            load_from_cache_file=False,
+        )
+        if cache_path:
+            # Write next to the final path and rename, so a crash never leaves a partial cache
+            tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+            tokenized_dataset.save_to_disk(tmp_path)
+            try:
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                # Another run cached the same key first
+                shutil.rmtree(tmp_path)
+            tokenized_dataset = load_from_disk(cache_path)
+            print(f"Saved tokenized dataset to {cache_path}")
+
+    max_samples = config["dataset"].get("max_samples")
+    if max_samples:
+        for split in tokenized_dataset:
+            tokenized_dataset[split] = tokenized_dataset[split].select(range(min(max_samples, len(tokenized_dataset[split]))))
+    return tokenized_dataset
+
+
+def pack_examples(tokenized, max_length, completion_only=False):
+    """Pack tokenized examples into blocks of at most max_length tokens.
+
+    First-fit decreasing keeps the blocks nearly full. position_ids restart at 0 for
+    every example, which is what lets the model keep examples from attending to
+    each other, and each example's first token gets no label so nothing is learned
+    across a boundary. With completion_only, labels start at each response_start.
+    """
+    from datasets import Dataset
+
+    lengths = [len(ids) for ids in tokenized["input_ids"]]
+    blocks = []  # [free tokens, example indices]
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        for block in blocks:
+            if block[0] >= lengths[i]:
+                block[0] -= lengths[i]
+                block[1].append(i)
+                break
+        else:
+            blocks.append([max_length - lengths[i], [i]])
+
+    packed = {"input_ids": [], "position_ids": [], "labels": []}
+    for _, indices in blocks:
+        input_ids, position_ids, labels = [], [], []
+        for i in indices:
+            ids = tokenized["input_ids"][i]
+            start = max(tokenized["response_start"][i], 1) if completion_only else 1
+            input_ids += ids
+            position_ids += range(len(ids))
+            labels += [-100] * start + ids[start:]
+        packed["input_ids"].append(input_ids)
+        packed["position_ids"].append(position_ids)
+        packed["labels"].append(labels)
+    return Dataset.from_dict(packed)
+
+
+class PackedDataCollator:
+    """Pads packed blocks to the longest in the batch.
+
+    No attention_mask is returned: the model then builds a block-diagonal causal
+    mask from the restarting position_ids. It only does so without a KV cache, hence
+    use_cache=False. Padding continues as one more sequence with no labels.
+    """
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        width = max(len(f["input_ids"]) for f in features)
+        batch = {"input_ids": [], "position_ids": [], "labels": []}
+        for f in features:
+            pad = width - len(f["input_ids"])
+            batch["input_ids"].append(list(f["input_ids"]) + [self.pad_token_id] * pad)
+            batch["position_ids"].append(list(f["position_ids"]) + list(range(pad)))
+            batch["labels"].append(list(f["labels"]) + [-100] * pad)
+        batch = {name: torch.tensor(values) for name, values in batch.items()}
+        batch["use_cache"] = False
+        return batch
+
+
+class CompletionOnlyDataCollator:
+    """Right-pads a batch and computes the loss on the answer tokens only.
+
+    Everything before each example's response_start (the preamble, instruction and
+    input) is masked from the labels, as is padding.
+    """
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        width = max(len(f["input_ids"]) for f in features)
+        batch = {"input_ids": [], "attention_mask": [], "labels": []}
+        for f in features:
+            ids = list(f["input_ids"])
+            start = f["response_start"]
+            pad = width - len(ids)
+            batch["input_ids"].append(ids + [self.pad_token_id] * pad)
+            batch["attention_mask"].append([1] * len(ids) + [0] * pad)
+            batch["labels"].append([-100] * start + ids[start:] + [-100] * pad)
+        return {name: torch.tensor(values) for name, values in batch.items()}
+
+
+class ThroughputCallback(TrainerCallback):
+    """Logs training throughput in real (non-padding) tokens per second.
+
+    Reads the Trainer's own count of the non-padding tokens in each step's batch
+    (include_num_input_tokens_seen="non_padding"), so length-sorted batch orders
+    and partial epochs are measured rather than estimated.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.start = None
+        self.tokens_per_sec = 0.0
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.perf_counter()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        elapsed = time.perf_counter() - self.start
+        if state.num_input_tokens_seen and elapsed > 0:
+            self.tokens_per_sec = state.num_input_tokens_seen / elapsed
+            if logs is not None:
+                logs["real_tokens_per_second"] = round(self.tokens_per_sec, 1)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        print(f"Throughput ({self.mode}): {self.tokens_per_sec:.1f} tokens/s")
+
+
+def batching_mode(config):
+    if config["training"].get("packing", False):
+        return "packing"
+    if config["training"].get("group_by_length", False):
+        return "group_by_length"
+    return "padding"
+
+
+def build_training_data(tokenized_dataset, tokenizer, config):
+    """Arrange the tokenized dataset for the configured batching mode.
+
+    Returns the train and eval datasets, the data collator, the TrainingArguments
+    overrides the mode needs. The Trainer must be given the tokenizer as
+    processing_class, which is how it tells padding from real tokens in packed
+    batches (they carry no attention_mask).
+    """
+    mode = batching_mode(config)
+    max_length = config["model"]["max_length"]
+    completion_only = config["training"].get("completion_only_loss", False)
+    tokens_per_epoch = sum(tokenized_dataset["train"]["length"])
+    # Feeds ThroughputCallback with the real tokens of every step's batch
+    args = {"include_num_input_tokens_seen": "non_padding"}
+    if completion_only:
+        train_lengths = tokenized_dataset["train"]["length"]
+        answer_tokens = sum(
+            length - min(start, length)
+            for length, start in zip(train_lengths, tokenized_dataset["train"]["response_start"])
+        )
+        print(f"Completion-only loss: {answer_tokens / tokens_per_epoch:.1%} of tokens are answer tokens")
+
+    if mode == "packing":
+        import importlib.util
+
+        # Older versions ignore restarting position_ids under sdpa/eager attention and
+        # would let packed examples attend to each other
+        if importlib.util.find_spec("transformers.masking_utils") is None:
+            raise ValueError("training.packing needs transformers>=4.53")
+        train_dataset = pack_examples(tokenized_dataset["train"], max_length, completion_only)
+        eval_dataset = pack_examples(tokenized_dataset["validation"], max_length, completion_only)
+        data_collator = PackedDataCollator(tokenizer.pad_token_id)
+        print(f"Packed {len(tokenized_dataset['train'])} examples into {len(train_dataset)} blocks "
+              f"({tokens_per_epoch / (len(train_dataset) * max_length):.1%} full)")
+        return train_dataset, eval_dataset, data_collator, args
+
+    if mode == "group_by_length":
+        # Renamed from group_by_length in transformers 5
+        if "train_sampling_strategy" in TrainingArguments.__dataclass_fields__:
+            args["train_sampling_strategy"] = "group_by_length"
+        else:
+            args["group_by_length"] = True
+        args["length_column_name"] = "length"
+
+    if completion_only:
+        data_collator = CompletionOnlyDataCollator(tokenizer.pad_token_id)
+        # response_start is not a model input, so the Trainer must not drop it
+        args["remove_unused_columns"] = False
+        return tokenized_dataset["train"], tokenized_dataset["validation"], data_collator, args
+
+    data_collator = DataCollatorForLanguageModeling(
+        tokenizer=tokenizer,
+        mlm=False
+    )
+    return tokenized_dataset["train"], tokenized_dataset["validation"], data_collator, args
 
 
 def train_model(config):
     print("Starting training...")
     
-    dataset = prepare_dataset(config)
     model, tokenizer = setup_model_and_tokenizer(config)
     
     print("\nTokenizing dataset...")
-    tokenized_dataset = dataset.map(
-        lambda x: tokenize_function(x, tokenizer, config["model"]["max_length"]),
-        batched=True,
-        remove_columns=["text"]
+    tokenized_dataset = load_tokenized_dataset(config, tokenizer)
+    mode = batching_mode(config)
+    train_dataset, eval_dataset, data_collator, mode_args = build_training_data(
+        tokenized_dataset, tokenizer, config
     )
+    print(f"Batching mode: {mode}")
     
 
     training_args = TrainingArguments(
@@ -148,21 +429,18 @@ def train_model(config):
         load_best_model_at_end=True,
         report_to="none",  # Disable wandb/tensorboard
         push_to_hub=False,
-    )
-    
-
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer,
-        mlm=False
+        **mode_args,
     )
     
 
     trainer = Trainer(
         model=model,
         args=training_args,
-        train_dataset=tokenized_dataset["train"],
-        eval_dataset=tokenized_dataset["validation"],
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
         data_collator=data_collator,
+        processing_class=tokenizer,
+        callbacks=[ThroughputCallback(mode)],
     )
     
     print("\nTraining...")
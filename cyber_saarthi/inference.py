@@ -1,94 +1,514 @@
 import os
+import time
 import yaml
-import torch
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-    pipeline
-)
-from peft import PeftModel, PeftConfig
+from threading import Event, Thread
+
+# torch, transformers and peft take seconds to import, so they are imported where they
+# are first needed. The Streamlit UI and `--help` can then start without them.
+
+from cyber_saarthi.cache import build_response_cache, build_semantic_cache, make_cache_key
+from cyber_saarthi.retrieval import build_retriever
+from cyber_saarthi.router import build_router
+from cyber_saarthi.telemetry import NULL_TRACE, Telemetry, build_telemetry
+
+
+PROMPT_PREAMBLE = "Below is an instruction that describes a task. Write a response that appropriately completes the request.\n\n"
+PROMPT_PREAMBLE_WITH_INPUT = "Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.\n\n"
+
+
+# The model was trained on single prompt/answer pairs and tends to follow an answer with
+# a fresh prompt; generation stops as soon as one of these appears
+STOP_STRINGS = ("Below is an instruction",)
+
+
+def find_stop(text, stop_strings=STOP_STRINGS):
+    """Return the index where the earliest stop string starts in text, or None"""
+    positions = [text.find(stop) for stop in stop_strings if stop in text]
+    return min(positions) if positions else None
+
+
+def truncate_at_stop(text, stop_strings=STOP_STRINGS):
+    stop = find_stop(text, stop_strings)
+    return text if stop is None else text[:stop]
+
+
+def stream_safe_length(text, stop_strings=STOP_STRINGS):
+    """Length of text that can be shown without leaking a stop string, even a partial one"""
+    stop = find_stop(text, stop_strings)
+    if stop is not None:
+        return stop
+    held = 0
+    for stop_string in stop_strings:
+        for n in range(len(stop_string) - 1, held, -1):
+            if text.endswith(stop_string[:n]):
+                held = n
+                break
+    return len(text) - held
+
+
+MERGED_MODEL_DIR = "merged"
+
+
+def find_merged_model(model_path):
+    """Return the merged export next to a LoRA adapter if it is up to date, else None"""
+    merged_path = os.path.join(model_path, MERGED_MODEL_DIR)
+    merged_config = os.path.join(merged_path, "config.json")
+    if not os.path.exists(merged_config):
+        return None
+    
+    for adapter_file in ("adapter_model.safetensors", "adapter_model.bin"):
+        adapter_weights = os.path.join(model_path, adapter_file)
+        if os.path.exists(adapter_weights) and os.path.getmtime(adapter_weights) > os.path.getmtime(merged_config):
+            print(f"Warning: merged checkpoint at {merged_path} is older than the adapter, ignoring it")
+            print("Re-export with: python -m cyber_saarthi.inference --export-merged")
+            return None
+    return merged_path
+
+
+def export_merged_model(model_path, output_dir=None, torch_dtype="auto"):
+    """Fold the LoRA adapter into its base model and save a standalone safetensors checkpoint"""
+    from peft import PeftConfig, PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if not os.path.exists(os.path.join(model_path, "adapter_config.json")):
+        raise ValueError(f"No LoRA adapter found at {model_path}")
+    output_dir = output_dir or os.path.join(model_path, MERGED_MODEL_DIR)
+    
+    peft_config = PeftConfig.from_pretrained(model_path)
+    print(f"Loading base model {peft_config.base_model_name_or_path}...")
+    # Merge in the base checkpoint's own precision unless told otherwise; saving in the
+    # serving dtype lets mmap_weights share the file without a conversion copy.
+    # 4-bit weights cannot be merged losslessly
+    if torch_dtype != "auto":
+        import torch
+        torch_dtype = getattr(torch, torch_dtype)
+    base_model = AutoModelForCausalLM.from_pretrained(
+        peft_config.base_model_name_or_path,
+        torch_dtype=torch_dtype,
+        trust_remote_code=True,
+    )
+    model = PeftModel.from_pretrained(base_model, model_path).merge_and_unload()
+    
+    print(f"Saving merged model to {output_dir}...")
+    model.save_pretrained(output_dir, safe_serialization=True)
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(output_dir)
+    print("✓ Merged model exported")
+    return output_dir
+
+
+SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+
+def load_safetensors_mmap(model_dir):
+    """Return a state dict whose tensors point straight into memory-mapped safetensors files.
+
+    The mapping is private copy-on-write, so untouched pages stay backed by the OS page
+    cache and are shared by every process that maps the same checkpoint.
+    """
+    import json
+    import mmap
+    import torch
+
+    state_dict = {}
+    shards = sorted(name for name in os.listdir(model_dir) if name.startswith("model") and name.endswith(".safetensors"))
+    if not shards:
+        raise ValueError(f"No model*.safetensors files found in {model_dir}")
+    for shard in shards:
+        with open(os.path.join(model_dir, shard), "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        # Layout: 8-byte little-endian header size, JSON header, then raw tensor data
+        header_size = int.from_bytes(buffer[:8], "little")
+        header = json.loads(buffer[8:8 + header_size])
+        data_start = 8 + header_size
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+            begin, end = info["data_offsets"]
+            if end == begin:
+                tensor = torch.empty(0, dtype=dtype)
+            else:
+                tensor = torch.frombuffer(
+                    buffer, dtype=dtype, count=(end - begin) // dtype.itemsize, offset=data_start + begin
+                )
+            state_dict[name] = tensor.view(info["shape"])
+    return state_dict
+
+
+def find_safetensors_checkpoint(name_or_path):
+    """Return a local directory holding name_or_path's model*.safetensors, or None.
+
+    Hub model ids resolve to their snapshot in the Hugging Face cache (downloading it
+    if needed), so adapter-based loads can memory-map the base weights too.
+    """
+    def has_safetensors(path):
+        return any(name.startswith("model") and name.endswith(".safetensors") for name in os.listdir(path))
+    
+    if os.path.isdir(name_or_path):
+        return name_or_path if has_safetensors(name_or_path) else None
+    
+    from huggingface_hub import snapshot_download
+    
+    try:
+        path = snapshot_download(name_or_path, allow_patterns=["*.json", "model*.safetensors"])
+    except Exception as e:
+        print(f"Warning: could not fetch safetensors for {name_or_path}: {e}")
+        return None
+    return path if has_safetensors(path) else None
+
+
+def kv_to_tensors(cache):
+    # DynamicCache moved from key_cache/value_cache lists to per-layer objects in transformers 5
+    if hasattr(cache, "layers"):
+        return [[layer.keys, layer.values] for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return [[k, v] for k, v in zip(cache.key_cache, cache.value_cache)]
+    return [[k, v] for k, v in cache]
+
+
+def tensors_to_kv(kv):
+    from transformers import DynamicCache
+
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(kv):
+        cache.update(k, v, layer_idx)
+    return cache
 
 
 class CyberSaarthiModel:
     
-    def __init__(self, model_path, load_in_4bit=True):
+    def __init__(
+        self,
+        model_path,
+        load_in_4bit=True,
+        response_cache=None,
+        semantic_cache=None,
+        use_prefix_cache=True,
+        prefer_merged=True,
+        cpu_config=None,
+        speculative_config=None,
+        retrieval_config=None,
+        router_config=None,
+        telemetry=None,
+        warmup=False,
+        background=False,
+    ):
         self.model_path = model_path
         self.load_in_4bit = load_in_4bit
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.prefer_merged = prefer_merged
+        self.cpu_config = cpu_config or {}
+        self.speculative_config = speculative_config or {}
+        self.use_prefix_cache = use_prefix_cache
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.retrieval_config = retrieval_config or {}
+        # Built before the model: it only needs the dataset, and takes a few milliseconds
+        self.retriever = build_retriever(self.retrieval_config)
+        self.router = build_router(router_config)
+        # Disabled unless configured: traces are then shared no-ops
+        self.telemetry = telemetry or Telemetry()
+        # True runs default_warmup after loading; a callable(model) runs a custom routine
+        self.warmup = warmup
         
-        print(f"Loading Cyber Saarthi model from {model_path}...")
-        self._load_model()
-        print(f"✓ Model loaded successfully on {self.device}")
+        self.load_error = None
+        self.load_metrics = {}
+        self._loaded = Event()
+        self._ready = Event()
+        self._created_at = time.perf_counter()
+        
+        if background:
+            Thread(target=self._start, name="cyber-saarthi-loader", daemon=True).start()
+        else:
+            self._start()
+            if self.load_error is not None:
+                raise self.load_error
+    
+    def _start(self):
+        try:
+            import torch
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            
+            print(f"Loading Cyber Saarthi model from {self.model_path}...")
+            start = time.perf_counter()
+            self._load_model()
+            self.load_metrics["load_time_sec"] = time.perf_counter() - start
+            print(f"✓ Model loaded successfully on {self.device}")
+        except Exception as e:
+            self.load_error = e
+            print(f"Error loading model: {e}")
+            self._loaded.set()
+            self._ready.set()
+            return
+        self._loaded.set()
+        
+        if self.warmup:
+            routine = self.warmup if callable(self.warmup) else default_warmup
+            start = time.perf_counter()
+            try:
+                self.load_metrics["warmup_runs"] = routine(self)
+            except Exception as e:
+                # A failed warm-up only costs latency later, the model itself is fine
+                self.load_metrics["warmup_error"] = str(e)
+                print(f"Warning: warm-up failed: {e}")
+            self.load_metrics["warmup_time_sec"] = time.perf_counter() - start
+        
+        self.load_metrics["time_to_ready_sec"] = time.perf_counter() - self._created_at
+        self._ready.set()
+    
+    def wait_until_loaded(self, timeout=None):
+        if not self._loaded.wait(timeout):
+            raise TimeoutError("Model is still loading")
+        if self.load_error is not None:
+            raise RuntimeError(f"Model failed to load: {self.load_error}") from self.load_error
+    
+    def is_loaded(self):
+        return self._loaded.is_set() and self.load_error is None
+    
+    def is_ready(self):
+        return self._ready.is_set() and self.load_error is None
+    
+    def health(self):
+        return {
+            "loaded": self.is_loaded(),
+            "ready": self.is_ready(),
+            "error": str(self.load_error) if self.load_error is not None else None,
+            **self.load_metrics,
+        }
+    
+    def _load_causal_lm(self, name_or_path):
+        import torch
+        from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+        
+        if self.load_in_4bit and self.device == "cuda":
+            bnb_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_use_double_quant=True,
+            )
+            
+            return AutoModelForCausalLM.from_pretrained(
+                name_or_path,
+                quantization_config=bnb_config,
+                device_map="auto",
+                trust_remote_code=True,
+            )
+        if self.device == "cpu" and self.cpu_config.get("mmap_weights", False):
+            checkpoint = find_safetensors_checkpoint(name_or_path)
+            if checkpoint:
+                return self._load_mmap_causal_lm(checkpoint)
+            print(f"No safetensors checkpoint for {name_or_path}, loading weights into process memory")
+        return AutoModelForCausalLM.from_pretrained(
+            name_or_path,
+            device_map="auto",
+            trust_remote_code=True,
+            **self._cpu_load_kwargs(),
+        )
+    
+    def _load_mmap_causal_lm(self, path):
+        from accelerate import init_empty_weights
+        from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+        
+        # Parameters are created on the meta device and then pointed at the mapped file,
+        # so no private copy of the weights is ever materialized
+        state_dict = load_safetensors_mmap(path)
+        config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+        with init_empty_weights():
+            model = AutoModelForCausalLM.from_config(config, trust_remote_code=True)
+        
+        dtype = self._cpu_load_kwargs().get("torch_dtype")
+        converted = {t.dtype for t in state_dict.values() if dtype and t.is_floating_point() and t.dtype != dtype}
+        if converted:
+            print(f"Warning: weights stored as {', '.join(map(str, converted))} are converted to {dtype}, "
+                  "so they cannot be shared between processes")
+            state_dict = {k: t.to(dtype) if t.is_floating_point() else t for k, t in state_dict.items()}
+        else:
+            self.load_metrics["mmap_weights"] = True
+        
+        model.load_state_dict(state_dict, strict=False, assign=True)
+        model.tie_weights()
+        if os.path.exists(os.path.join(path, "generation_config.json")):
+            model.generation_config = GenerationConfig.from_pretrained(path)
+        missing = [name for name, param in model.named_parameters() if param.is_meta]
+        if missing:
+            raise ValueError(f"Checkpoint at {path} has no weights for: {', '.join(missing[:5])}")
+        print(f"✓ Memory-mapped weights from {path}")
+        return model
+    
+    def _cpu_load_kwargs(self):
+        import torch
+        
+        if self.device != "cpu" or "dtype" not in self.cpu_config:
+            return {}
+        # Dynamic int8 kernels take float32 activations, so bf16 only applies without it
+        if self.cpu_config.get("int8_dynamic_quantization", False):
+            return {"torch_dtype": torch.float32}
+        return {"torch_dtype": getattr(torch, self.cpu_config["dtype"])}
+    
+    def _apply_cpu_optimizations(self):
+        import torch
+        from peft import PeftModel
+        
+        if self.device != "cpu":
+            return
+        
+        num_threads = self.cpu_config.get("num_threads")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        
+        if self.cpu_config.get("int8_dynamic_quantization", False):
+            if isinstance(self.model, PeftModel):
+                # Quantize the merged weights, not the base and LoRA matrices separately
+                self.model = self.model.merge_and_unload()
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            # Quantized Linear layers hold private int8 copies, only embeddings stay mapped
+            self.load_metrics.pop("mmap_weights", None)
+        
+        if self.cpu_config.get("compile", False):
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
     
     def _load_model(self):
-
-        if os.path.exists(os.path.join(self.model_path, "adapter_config.json")):
+        from peft import PeftConfig, PeftModel
+        from transformers import AutoTokenizer
+        
+        merged_path = find_merged_model(self.model_path) if self.prefer_merged else None
+        
+        if merged_path:
+            # LoRA weights are already folded in, so decoding runs no extra adapter ops
+            print(f"Using merged checkpoint at {merged_path}")
+            self.model = self._load_causal_lm(merged_path)
+            self.tokenizer = AutoTokenizer.from_pretrained(merged_path)
+        elif os.path.exists(os.path.join(self.model_path, "adapter_config.json")):
             peft_config = PeftConfig.from_pretrained(self.model_path)
-            
-            if self.load_in_4bit and self.device == "cuda":
-                bnb_config = BitsAndBytesConfig(
-                    load_in_4bit=True,
-                    bnb_4bit_quant_type="nf4",
-                    bnb_4bit_compute_dtype=torch.bfloat16,
-                    bnb_4bit_use_double_quant=True,
-                )
-                
-                base_model = AutoModelForCausalLM.from_pretrained(
-                    peft_config.base_model_name_or_path,
-                    quantization_config=bnb_config,
-                    device_map="auto",
-                    trust_remote_code=True,
-                )
-            else:
-                base_model = AutoModelForCausalLM.from_pretrained(
-                    peft_config.base_model_name_or_path,
-                    device_map="auto",
-                    trust_remote_code=True,
-                )
+            base_model = self._load_causal_lm(peft_config.base_model_name_or_path)
             
             self.model = PeftModel.from_pretrained(base_model, self.model_path)
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
         else:
-            if self.load_in_4bit and self.device == "cuda":
-                bnb_config = BitsAndBytesConfig(
-                    load_in_4bit=True,
-                    bnb_4bit_quant_type="nf4",
-                    bnb_4bit_compute_dtype=torch.bfloat16,
-                    bnb_4bit_use_double_quant=True,
-                )
-                
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    quantization_config=bnb_config,
-                    device_map="auto",
-                    trust_remote_code=True,
-                )
-            else:
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    device_map="auto",
-                    trust_remote_code=True,
-                )
-            
+            self.model = self._load_causal_lm(self.model_path)
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
         
         self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Left padding keeps every prompt flush against the generated tokens in batched mode
+        self.tokenizer.padding_side = "left"
         self.model.eval()
+        self._apply_cpu_optimizations()
+        self.last_batch_stats = None
+        self._build_prefix_cache()
+        self._build_drafter()
+    
+    def _stopping_criteria(self, prompt_length, stop_event=None):
+        from transformers import StoppingCriteriaList
+        from cyber_saarthi.stopping import StopOnEvent, StopOnStrings
+        
+        criteria = [StopOnStrings(self.tokenizer, prompt_length)]
+        if stop_event is not None:
+            criteria.append(StopOnEvent(stop_event))
+        return StoppingCriteriaList(criteria)
+    
+    def _build_drafter(self):
+        self.drafter = None
+        self.last_speculative_stats = None
+        if not self.speculative_config.get("enabled", False):
+            return
+        from cyber_saarthi.speculative import build_drafter
+        
+        self.drafter = build_drafter(self.speculative_config, self.tokenizer, self._cpu_load_kwargs().get("torch_dtype"))
+        print(f"✓ Speculative decoding enabled ({self.speculative_config.get('method', 'ngram')})")
+    
+    def _build_prefix_cache(self):
+        import torch
+        
+        # Every prompt starts with one of two fixed preambles, so encode them once up front
+        self.prefix_cache = []
+        if not self.use_prefix_cache:
+            return
+        for preamble in (PROMPT_PREAMBLE, PROMPT_PREAMBLE_WITH_INPUT):
+            prefix_ids = self.tokenizer(preamble)["input_ids"]
+            with torch.no_grad():
+                outputs = self.model(input_ids=torch.tensor([prefix_ids], device=self.device), use_cache=True)
+            self.prefix_cache.append((prefix_ids, kv_to_tensors(outputs.past_key_values)))
+    
+    def _match_prefix(self, encoded):
+        for prefix_ids, prefix_kv in self.prefix_cache:
+            n = len(prefix_ids)
+            if all(len(ids) > n and ids[:n] == prefix_ids for ids in encoded):
+                return prefix_ids, prefix_kv
+        return [], None
+    
+    def build_prefill_batch(self, encoded):
+        import torch
+        
+        # Layout per row is [shared prefix][padding][rest of prompt]. Without a cached
+        # prefix this is plain left padding; with one, the prefix KV is reused as-is
+        # and position ids derived from the attention mask stay contiguous.
+        prefix_ids, prefix_kv = self._match_prefix(encoded)
+        n_prefix = len(prefix_ids)
+        width = max(len(ids) for ids in encoded) - n_prefix
+        pad_id = self.tokenizer.pad_token_id
+        
+        input_ids = []
+        attention_mask = []
+        for ids in encoded:
+            n_pad = width - (len(ids) - n_prefix)
+            input_ids.append(prefix_ids + [pad_id] * n_pad + ids[n_prefix:])
+            attention_mask.append([1] * n_prefix + [0] * n_pad + [1] * (len(ids) - n_prefix))
+        
+        inputs = {
+            "input_ids": torch.tensor(input_ids, device=self.device),
+            "attention_mask": torch.tensor(attention_mask, device=self.device),
+        }
+        if prefix_kv is not None:
+            inputs["past_key_values"] = tensors_to_kv(
+                [[t.expand(len(encoded), -1, -1, -1) for t in layer] for layer in prefix_kv]
+            )
+        return inputs
+    
+    def _prepare_inputs(self, prompts, trace=NULL_TRACE):
+        # Cache hits are answered before this point, so only real generations wait for loading
+        self.wait_until_loaded()
+        with trace.stage("tokenize"):
+            encoded = self.tokenizer(prompts, truncation=True, max_length=2048)["input_ids"]
+        # Builds the padded tensors on the model's device
+        with trace.stage("prefill_batch"):
+            return self.build_prefill_batch(encoded)
+    
+    def route(self, instruction, input_text=""):
+        """Curated answer for a plain section lookup, or None to run the model"""
+        if self.router is None:
+            return None
+        return self.router.route(instruction, input_text)
+    
+    def retrieve_context(self, instruction, input_text=""):
+        """Fill an empty input_text with the statute passages retrieved for the instruction"""
+        if input_text or self.retriever is None:
+            return input_text
+        return self.retriever.context(
+            instruction,
+            k=self.retrieval_config.get("top_k", 2),
+            max_chars=self.retrieval_config.get("max_context_chars", 1500),
+        )
     
     def format_prompt(self, instruction, input_text=""):
         if input_text:
-            prompt = f"""Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.
-
-{instruction}
+            prompt = f"""{PROMPT_PREAMBLE_WITH_INPUT}{instruction}
 
 {input_text}
 
 """
         else:
-            prompt = f"""Below is an instruction that describes a task. Write a response that appropriately completes the request.
-
-{instruction}
+            prompt = f"""{PROMPT_PREAMBLE}{instruction}
 
 """
         return prompt
@@ -104,41 +524,401 @@ class CyberSaarthiModel:
         repetition_penalty=1.1,
         do_sample=True,
     ):
-
-        prompt = self.format_prompt(instruction, input_text)
+        import torch
         
+        gen_params = dict(
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=repetition_penalty,
+            do_sample=do_sample,
+        )
+        trace = self.telemetry.trace("generate")
+        with trace.stage("route"):
+            routed = self.route(instruction, input_text)
+        if routed is not None:
+            trace.finish(source="router")
+            return routed
+        with trace.stage("retrieve"):
+            input_text = self.retrieve_context(instruction, input_text)
+        with trace.stage("cache_lookup"):
+            cached = self.cache_lookup(instruction, input_text, gen_params)
+        if cached is not None:
+            trace.finish(source="cache")
+            return cached
 
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048)
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        prompt = self.format_prompt(instruction, input_text)
         
 
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                top_k=top_k,
-                repetition_penalty=repetition_penalty,
-                do_sample=do_sample,
-                pad_token_id=self.tokenizer.eos_token_id,
-            )
+        try:
+            inputs = self._prepare_inputs([prompt], trace)
+            prompt_length = inputs["input_ids"].shape[1]
+            trace.prompt_tokens = prompt_length
         
-
-        full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            with self.telemetry.profile(trace):
+                if self.drafter is not None:
+                    from cyber_saarthi.speculative import speculative_generate
+                    from cyber_saarthi.stopping import StopOnStrings
+                
+                    # Draft and verify interleave, so speculative decoding is timed as a whole
+                    with trace.stage("speculative_decode"):
+                        outputs, self.last_speculative_stats = speculative_generate(
+                            self.model, inputs, self.drafter, gen_params, self.tokenizer.eos_token_id,
+                            stopping=StopOnStrings(self.tokenizer),
+                        )
+                else:
+                    self.last_speculative_stats = None
+                    with torch.no_grad():
+                        outputs = self.model.generate(
+                            **inputs,
+                            **gen_params,
+                            pad_token_id=self.tokenizer.eos_token_id,
+                            stopping_criteria=self._stopping_criteria(prompt_length),
+                            streamer=trace.generation_timer(),
+                        )
+        except Exception as e:
+            trace.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        trace.new_tokens = outputs.shape[1] - prompt_length
         
-
-        if "### Response:" in full_response:
-            response = full_response.split("### Response:")[-1].strip()
-        else:
-            response = full_response
+        # Only the new tokens: the prompt itself is not part of the answer
+        with trace.stage("detokenize"):
+            response = self.tokenizer.decode(outputs[0, prompt_length:], skip_special_tokens=True)
+        with trace.stage("postprocess"):
+            response = truncate_at_stop(response).strip()
         
+        with trace.stage("cache_store"):
+            self.cache_store(instruction, input_text, gen_params, response)
+        trace.finish()
         return response
     
+    def generate_stream(
+        self,
+        instruction,
+        input_text="",
+        max_new_tokens=512,
+        temperature=0.7,
+        top_p=0.9,
+        top_k=50,
+        repetition_penalty=1.1,
+        do_sample=True,
+    ):
+        import torch
+        from transformers import TextIteratorStreamer
+        
+        gen_params = dict(
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=repetition_penalty,
+            do_sample=do_sample,
+        )
+        trace = self.telemetry.trace("generate_stream")
+        with trace.stage("route"):
+            routed = self.route(instruction, input_text)
+        if routed is not None:
+            trace.finish(source="router")
+            yield routed
+            return
+        with trace.stage("retrieve"):
+            input_text = self.retrieve_context(instruction, input_text)
+        with trace.stage("cache_lookup"):
+            cached = self.cache_lookup(instruction, input_text, gen_params)
+        if cached is not None:
+            trace.finish(source="cache")
+            yield cached
+            return
+        
+        prompt = self.format_prompt(instruction, input_text)
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        # Set when the caller stops reading, so generation ends at the next step
+        stop_event = Event()
+        
+        def run_generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        **gen_params,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        streamer=streamer,
+                        stopping_criteria=self._stopping_criteria(inputs["input_ids"].shape[1], stop_event),
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer loop below
+                streamer.end()
+        
+        text = ""
+        shown = 0
+        try:
+            inputs = self._prepare_inputs([prompt], trace)
+            trace.prompt_tokens = inputs["input_ids"].shape[1]
+            
+            thread = Thread(target=run_generate, daemon=True)
+            stream_started = time.perf_counter()
+            thread.start()
+            for chunk in streamer:
+                text += chunk
+                # Hold back anything that could turn out to be the start of a stop string
+                safe = stream_safe_length(text)
+                if safe > shown:
+                    trace.mark_first_token()
+                    yield text[shown:safe]
+                    shown = safe
+            thread.join()
+            # Includes the time the caller spent between chunks
+            trace.add_stage("stream", time.perf_counter() - stream_started)
+            if errors:
+                raise errors[0]
+            text = truncate_at_stop(text)
+            if len(text) > shown:
+                trace.mark_first_token()
+                yield text[shown:]
+        except GeneratorExit:
+            # The caller stopped reading before the answer was complete: stop decoding for it
+            stop_event.set()
+            thread.join()
+            trace.finish(error="cancelled")
+            raise
+        except Exception as e:
+            trace.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        self.cache_store(instruction, input_text, gen_params, text.strip())
+        if trace.enabled:
+            # The text streamer does not count tokens, so re-encode the answer
+            trace.new_tokens = len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        trace.finish()
+    
+    def _cacheable(self, cache, gen_params):
+        # Sampled answers differ run to run, so only cache them when explicitly allowed
+        return cache is not None and (not gen_params["do_sample"] or cache.allow_sampled)
+    
+    def cache_key(self, instruction, input_text, gen_params):
+        if not self._cacheable(self.response_cache, gen_params):
+            return None
+        return make_cache_key(instruction, input_text, gen_params)
+    
+    def cache_lookup(self, instruction, input_text, gen_params):
+        cache_key = self.cache_key(instruction, input_text, gen_params)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if self._cacheable(self.semantic_cache, gen_params):
+            namespace = make_cache_key("", input_text, gen_params)
+            cached = self.semantic_cache.get(instruction, namespace)
+            if cached is not None:
+                # Promote paraphrase hits so an identical repeat skips the embedding
+                if cache_key is not None:
+                    self.response_cache.set(cache_key, cached)
+                return cached
+        return None
+    
+    def cache_store(self, instruction, input_text, gen_params, response):
+        cache_key = self.cache_key(instruction, input_text, gen_params)
+        if cache_key is not None:
+            self.response_cache.set(cache_key, response)
+        if self._cacheable(self.semantic_cache, gen_params):
+            self.semantic_cache.set(instruction, make_cache_key("", input_text, gen_params), response)
+    
+    def _count_new_tokens(self, generated):
+        import torch
+        
+        # Rows that finish early are padded with eos, so count up to and including the first eos
+        is_eos = generated == self.tokenizer.eos_token_id
+        first_eos = torch.where(
+            is_eos.any(dim=1),
+            is_eos.int().argmax(dim=1) + 1,
+            torch.full((generated.shape[0],), generated.shape[1], device=generated.device),
+        )
+        return first_eos.tolist()
+    
+    def generate_batch(
+        self,
+        instructions,
+        input_texts=None,
+        max_new_tokens=512,
+        temperature=0.7,
+        top_p=0.9,
+        top_k=50,
+        repetition_penalty=1.1,
+        do_sample=True,
+        batch_size=8,
+    ):
+        import torch
+        
+        if input_texts is None:
+            input_texts = [""] * len(instructions)
+        if len(input_texts) != len(instructions):
+            raise ValueError("input_texts must have the same length as instructions")
+        trace = self.telemetry.trace("generate_batch")
+        with trace.stage("route"):
+            routed = [
+                self.route(instruction, input_text)
+                for instruction, input_text in zip(instructions, input_texts)
+            ]
+        with trace.stage("retrieve"):
+            input_texts = [
+                self.retrieve_context(instruction, input_text)
+                for instruction, input_text in zip(instructions, input_texts)
+            ]
+        
+        gen_params = dict(
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=repetition_penalty,
+            do_sample=do_sample,
+        )
+        cache_keys = [
+            self.cache_key(instruction, input_text, gen_params)
+            for instruction, input_text in zip(instructions, input_texts)
+        ]
+        with trace.stage("cache_lookup"):
+            responses = [
+                answer if answer is not None else self.cache_lookup(instruction, input_text, gen_params)
+                for answer, instruction, input_text in zip(routed, instructions, input_texts)
+            ]
+        # Only cache misses go through the model, and normalized duplicates only once
+        pending = []
+        duplicate_of = {}
+        first_seen = {}
+        for i, response in enumerate(responses):
+            if response is not None:
+                continue
+            key = cache_keys[i]
+            if key is not None and key in first_seen:
+                duplicate_of[i] = first_seen[key]
+                continue
+            if key is not None:
+                first_seen[key] = i
+            pending.append(i)
+        
+        total_prompt_tokens = 0
+        total_new_tokens = 0
+        start = time.perf_counter()
+        
+        for i in range(0, len(pending), batch_size):
+            batch_indices = pending[i:i + batch_size]
+            prompts = [self.format_prompt(instructions[j], input_texts[j]) for j in batch_indices]
+            
+            try:
+                inputs = self._prepare_inputs(prompts, trace)
+                prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+                
+                with self.telemetry.profile(trace), torch.no_grad():
+                    outputs = self.model.generate(
+                        **inputs,
+                        **gen_params,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        stopping_criteria=self._stopping_criteria(inputs["input_ids"].shape[1]),
+                        streamer=trace.generation_timer(),
+                    )
+            except Exception as e:
+                trace.finish(error=f"{type(e).__name__}: {e}")
+                raise
+            
+            # Padding sits before (or inside) each row's prompt, never after it, so every
+            # row's answer starts at the same column: the padded prompt width
+            padded_width = inputs["input_ids"].shape[1]
+            generated = outputs[:, padded_width:]
+            new_token_counts = self._count_new_tokens(generated)
+            
+            for row, (j, n_new) in enumerate(zip(batch_indices, new_token_counts)):
+                with trace.stage("detokenize"):
+                    text = self.tokenizer.decode(generated[row, :n_new], skip_special_tokens=True)
+                with trace.stage("postprocess"):
+                    responses[j] = truncate_at_stop(text).strip()
+                with trace.stage("cache_store"):
+                    self.cache_store(instructions[j], input_texts[j], gen_params, responses[j])
+            total_prompt_tokens += sum(prompt_lengths)
+            total_new_tokens += sum(new_token_counts)
+        
+        for i, j in duplicate_of.items():
+            responses[i] = responses[j]
+        
+        elapsed = time.perf_counter() - start
+        # Each prompt is answered by exactly one of: router, cache, an identical prompt in this call, the model
+        router_hits = sum(answer is not None for answer in routed)
+        cache_hits = len(instructions) - len(pending) - len(duplicate_of) - router_hits
+        self.last_batch_stats = {
+            "num_prompts": len(instructions),
+            "batch_size": batch_size,
+            "router_hits": router_hits,
+            "cache_hits": cache_hits,
+            "deduplicated": len(duplicate_of),
+            "prompt_tokens": total_prompt_tokens,
+            "new_tokens": total_new_tokens,
+            "elapsed_sec": elapsed,
+            "tokens_per_sec": total_new_tokens / elapsed if elapsed > 0 else 0.0,
+        }
+        trace.prompt_tokens = total_prompt_tokens
+        trace.new_tokens = total_new_tokens
+        trace.set(num_prompts=len(instructions), batch_size=batch_size, router_hits=router_hits, cache_hits=cache_hits,
+                  deduplicated=len(duplicate_of))
+        trace.finish(source="model" if pending else ("cache" if cache_hits else "router"))
+        return responses
+    
     def chat(self, instruction, **kwargs):
         return self.generate(instruction, **kwargs)
 
 
+# Shown as quick-start buttons in the chatbot UI and mixed into load tests
+EXAMPLE_QUERIES = [
+    "What is Section 66C of the IT Act?",
+    "What are the penalties for hacking in India?",
+    "How do I report a cybercrime?",
+    "Explain Section 43A about data protection",
+    "What is identity theft under Indian cyber law?",
+    "What is cyber terrorism according to Indian law?",
+    "What are the privacy laws in India?",
+    "What is CERT-In and what does it do?",
+    "What are cybersecurity best practices for individuals?",
+    "Can the government intercept online communications?",
+]
+
+
+WARMUP_INSTRUCTIONS = [
+    "Hi",
+    "What is Section 66C of the IT Act?",
+    "Explain the difference between Section 43 and Section 66 of the IT Act, including the penalties under each and an example of an offence that falls under both sections.",
+]
+
+
+def default_warmup(model, max_new_tokens=16, batch_size=4):
+    """Run short greedy generations over representative prompt lengths and batch sizes"""
+    import torch
+    
+    # Calls model.model.generate directly so warm-up answers never land in the response caches
+    shapes = [[instruction] for instruction in WARMUP_INSTRUCTIONS]
+    shapes.append((WARMUP_INSTRUCTIONS * batch_size)[:batch_size])
+    
+    runs = []
+    for instructions in shapes:
+        inputs = model._prepare_inputs([model.format_prompt(instruction) for instruction in instructions])
+        start = time.perf_counter()
+        with torch.no_grad():
+            model.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=model.tokenizer.eos_token_id,
+            )
+        runs.append({
+            "batch_size": len(instructions),
+            "prompt_tokens": inputs["input_ids"].shape[1],
+            "seconds": time.perf_counter() - start,
+        })
+    return runs
+
+
 def load_config(config_path="config.yaml"):
     if os.path.exists(config_path):
         with open(config_path, 'r') as f:
@@ -146,9 +926,26 @@ def load_config(config_path="config.yaml"):
     return {}
 
 
+def load_model_from_config(model_path, config, **overrides):
+    """Build a CyberSaarthiModel with the caches and CPU settings described in config.yaml"""
+    cache_config = config.get("cache", {})
+    kwargs = {
+        "response_cache": build_response_cache(cache_config),
+        "cpu_config": config.get("cpu_inference"),
+        "speculative_config": config.get("speculative"),
+        "retrieval_config": config.get("retrieval"),
+        "router_config": config.get("router"),
+        "telemetry": build_telemetry(config.get("telemetry")),
+    }
+    kwargs.update(overrides)
+    model = CyberSaarthiModel(model_path, **kwargs)
+    model.semantic_cache = build_semantic_cache(cache_config.get("semantic", {}), model)
+    return model
+
+
 def test_inference(model_path):
 
-    model = CyberSaarthiModel(model_path)
+    model = CyberSaarthiModel(model_path, cpu_config=load_config().get("cpu_inference"))
     
 
     test_queries = [
@@ -163,19 +960,23 @@ def test_inference(model_path):
     print("Testing Cyber Saarthi Model")
     print("=" * 70)
     
-    for query in test_queries:
+    responses = model.generate_batch(test_queries, max_new_tokens=300, temperature=0.7)
+    
+    for query, response in zip(test_queries, responses):
         print(f"\n📝 Query: {query}")
         print("-" * 70)
-        response = model.generate(query, max_new_tokens=300, temperature=0.7)
         print(f"🤖 Response: {response}")
         print("=" * 70)
+    
+    stats = model.last_batch_stats
+    print(f"\n⚡ {stats['new_tokens']} tokens in {stats['elapsed_sec']:.2f}s ({stats['tokens_per_sec']:.1f} tokens/sec)")
 
 
 def interactive_mode(model_path):
-    model = CyberSaarthiModel(model_path)
+    config = load_config()
+    model = load_model_from_config(model_path, config)
     
 
-    config = load_config()
     gen_config = config.get("generation", {})
     
     print("\n" + "=" * 70)
@@ -197,7 +998,7 @@ def interactive_mode(model_path):
                 continue
             
             print("\nCyber Saarthi: ", end="", flush=True)
-            response = model.generate(
+            stream = model.generate_stream(
                 query,
                 max_new_tokens=gen_config.get("max_new_tokens", 512),
                 temperature=gen_config.get("temperature", 0.7),
@@ -206,7 +1007,9 @@ def interactive_mode(model_path):
                 repetition_penalty=gen_config.get("repetition_penalty", 1.1),
                 do_sample=gen_config.get("do_sample", True),
             )
-            print(response + "\n")
+            for text in stream:
+                print(text, end="", flush=True)
+            print("\n")
             
         except KeyboardInterrupt:
             print("\n\nThank you for using Cyber Saarthi! Stay safe online! 🛡️")
@@ -224,6 +1027,12 @@ def main():
                         help="Path to the fine-tuned model")
     parser.add_argument("--test", action="store_true", help="Run test queries")
     parser.add_argument("--interactive", action="store_true", help="Interactive chat mode")
+    parser.add_argument("--export-merged", action="store_true",
+                        help="Merge the LoRA adapter into the base model and save it for fast loading")
+    parser.add_argument("--output-dir", default=None,
+                        help="Where to write the merged model (default: <model-path>/merged)")
+    parser.add_argument("--dtype", default="auto",
+                        help="dtype of the merged weights, e.g. float32 to match cpu_inference.dtype")
     args = parser.parse_args()
     
     if not os.path.exists(args.model_path):
@@ -231,7 +1040,9 @@ def main():
         print("Please train the model first using: python -m cyber_saarthi.fine_tune")
         return
     
-    if args.test:
+    if args.export_merged:
+        export_merged_model(args.model_path, args.output_dir, args.dtype)
+    elif args.test:
         test_inference(args.model_path)
     elif args.interactive:
         interactive_mode(args.model_path)
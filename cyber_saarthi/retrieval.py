@@ -0,0 +1,219 @@
+"""
+In-process BM25 retrieval over the curated statute corpus in dataset_generator.
+
+The index is a flat inverted index: one sorted vocabulary, and for every term a slice
+of two NumPy arrays (document ids and precomputed BM25 weights). A query is a handful
+of array slices and one argpartition, so retrieval takes microseconds and the whole
+index can be saved to a single .npz file and loaded without re-tokenizing the corpus.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+from cyber_saarthi.cache import WORD_PATTERN, normalize_instruction, section_ids
+
+# Bare identifiers with a letter suffix ("66C", "43a") are unambiguous section ids
+BARE_SECTION_PATTERN = re.compile(r"\b(\d{1,3}[a-z])\b")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or the to under what when "
+    "which who why with about tell explain".split()
+)
+
+
+def query_sections(text):
+    """Section ids in text: "Section 66" style mentions plus bare ids such as "66C" """
+    return section_ids(text) | frozenset(BARE_SECTION_PATTERN.findall(normalize_instruction(text)))
+
+
+def tokenize(text):
+    return [token for token in WORD_PATTERN.findall(normalize_instruction(text)) if token not in STOPWORDS]
+
+
+def load_corpus():
+    """Curated passages: every CYBER_LAWS_DATA answer plus the ADDITIONAL_TOPICS with real answers"""
+    from cyber_saarthi.dataset_generator import ADDITIONAL_TOPICS, CYBER_LAWS_DATA, generate_response
+
+    passages = []
+    seen = set()
+    for item in CYBER_LAWS_DATA:
+        if item["output"] not in seen:
+            seen.add(item["output"])
+            passages.append({"title": item["instruction"], "text": item["output"]})
+    for question in ADDITIONAL_TOPICS:
+        answer = generate_response(question)
+        if answer is not None and answer not in seen:
+            seen.add(answer)
+            passages.append({"title": question, "text": answer})
+    return passages
+
+
+class BM25Index:
+
+    def __init__(self, passages, k1=1.2, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+
+        # Title words count too: they name the topic even when the answer paraphrases it
+        docs = [tokenize(p["title"] + " " + p["text"]) for p in passages]
+        doc_lengths = np.array([len(tokens) for tokens in docs], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(docs) else 1.0
+
+        term_freqs = {}
+        for doc_id, tokens in enumerate(docs):
+            for token in tokens:
+                postings = term_freqs.setdefault(token, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+
+        self.vocab = {term: i for i, term in enumerate(sorted(term_freqs))}
+        offsets = [0]
+        doc_ids = []
+        weights = []
+        for term in sorted(term_freqs):
+            postings = term_freqs[term]
+            idf = np.log(1 + (len(docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id in sorted(postings):
+                tf = postings[doc_id]
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets.append(len(doc_ids))
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.doc_ids = np.array(doc_ids, dtype=np.int32)
+        self.weights = np.array(weights, dtype=np.float32)
+        self._build_section_index()
+
+    def _build_section_index(self):
+        # section id -> [(tier, doc id)]; tier 0 passages are about that section alone,
+        # tier 1 name it in the title next to others, tier 2 only mention it in the text
+        self.section_index = {}
+        for doc_id, passage in enumerate(self.passages):
+            title_sections = query_sections(passage["title"])
+            for section in title_sections | query_sections(passage["text"]):
+                if section not in title_sections:
+                    tier = 2
+                else:
+                    tier = 0 if len(title_sections) == 1 else 1
+                self.section_index.setdefault(section, []).append((tier, doc_id))
+
+    def scores(self, query):
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # Each document appears once per term, so plain fancy-index addition is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query, k=3):
+        """Return [(passage, score)], best first. Named sections are looked up directly."""
+        scores = self.scores(query)
+        # Passages covering more of the named sections first, then by tier and BM25 score
+        coverage = {}
+        for section in query_sections(query):
+            for tier, doc_id in self.section_index.get(section, []):
+                count, best_tier = coverage.get(doc_id, (0, tier))
+                coverage[doc_id] = (count + 1, min(best_tier, tier))
+        ranked = sorted(coverage, key=lambda d: (-coverage[d][0], coverage[d][1], -scores[d], d))
+        results = [(doc_id, float("inf")) for doc_id in ranked[:k]]
+        if len(results) < k:
+            n = min(k + len(results), len(scores))
+            top = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+            for doc_id in top[np.argsort(-scores[top], kind="stable")]:
+                if scores[doc_id] <= 0 or len(results) >= k:
+                    break
+                if doc_id not in {d for d, _ in results}:
+                    results.append((int(doc_id), float(scores[doc_id])))
+        return [(self.passages[doc_id], score) for doc_id, score in results[:k]]
+
+    def context(self, query, k=2, max_chars=1500):
+        """Retrieved passages formatted as the prompt's input_text, or "" when nothing matches"""
+        lines = []
+        used = 0
+        for i, (passage, _) in enumerate(self.search(query, k), 1):
+            text = passage["text"]
+            if used + len(text) > max_chars:
+                # Cut at a word boundary, and drop passages that would be cut to a stub
+                text = text[:max_chars - used].rsplit(" ", 1)[0]
+                if len(text) < 100:
+                    break
+            lines.append(f"[{i}] {text}")
+            used += len(text)
+        return "\n".join(lines)
+
+    def save(self, path):
+        np.savez(
+            path,
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            weights=self.weights,
+            meta=np.frombuffer(json.dumps({
+                "vocab": sorted(self.vocab, key=self.vocab.get),
+                "passages": self.passages,
+                "k1": self.k1,
+                "b": self.b,
+            }).encode("utf-8"), dtype=np.uint8),
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        index = cls.__new__(cls)
+        index.passages = meta["passages"]
+        index.k1 = meta["k1"]
+        index.b = meta["b"]
+        index.vocab = {term: i for i, term in enumerate(meta["vocab"])}
+        index.offsets = data["offsets"]
+        index.doc_ids = data["doc_ids"]
+        index.weights = data["weights"]
+        index._build_section_index()
+        return index
+
+
+def build_retriever(retrieval_config):
+    """Create the index described by `retrieval` in config.yaml, or None"""
+    if not retrieval_config or not retrieval_config.get("enabled", False):
+        return None
+    index_path = retrieval_config.get("index_path")
+    if index_path and os.path.exists(index_path):
+        return BM25Index.load(index_path)
+    index = BM25Index(load_corpus(), k1=retrieval_config.get("k1", 1.2), b=retrieval_config.get("b", 0.75))
+    if index_path:
+        index.save(index_path)
+        print(f"✓ Saved retrieval index to {index_path}")
+    return index
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build or query the BM25 statute index")
+    parser.add_argument("--index-path", default="./data/retrieval_index.npz", help="Where to save the index")
+    parser.add_argument("--query", default=None, help="Query the freshly built index")
+    parser.add_argument("--k", type=int, default=3, help="Passages to retrieve")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = BM25Index(load_corpus())
+    index.save(args.index_path)
+    print(f"✓ Indexed {len(index.passages)} passages, {len(index.vocab)} terms in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms -> {args.index_path}")
+
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query, args.k)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(f"\nTop {args.k} for {args.query!r} ({elapsed_us:.0f} µs):")
+        for passage, score in results:
+            print(f"  {score:6.2f}  {passage['title']}")
+
+
+if __name__ == "__main__":
+    main()
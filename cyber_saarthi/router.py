@@ -0,0 +1,131 @@
+"""
+Answer-from-corpus fast path for exact section lookups.
+
+"What is Section 66?" and its templated variants (the ones create_dataset trains on)
+have one canonical answer in CYBER_LAWS_DATA. The router matches the whole normalized
+question against a precompiled regex and returns that answer without touching the
+model. Anything it is not sure about, including questions with extra words such as
+"What is Section 66 for minors?", falls through to the model, and so does every
+section without a CYBER_LAWS_DATA entry (66C, for one). Disabled by default; see
+`router` in config.yaml.
+"""
+import re
+import threading
+
+from cyber_saarthi.cache import normalize_instruction
+from cyber_saarthi.retrieval import query_sections
+
+# Lead-ins and tails of the section questions in create_dataset
+SECTION_PREFIXES = (
+    "what is", "what does", "explain", "describe", "define", "meaning of", "tell me about",
+    "i need information on", "i want to know about", "help me understand", "can you explain",
+)
+SECTION_SUFFIXES = ("about", "say", "mean", "meaning", "to me", "in simple terms")
+COMPARISON_PREFIXES = ("what is the difference between", "difference between", "compare", "how are")
+ACT_PATTERN = r"(?: of (?:the )?it act(?: 2000)?)?"
+
+
+def trie_pattern(words):
+    """Regex alternation shaped like a trie over words: ["66", "66b", "67"] -> "6(?:6b?|7)" """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node):
+        end = "" in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # A shorter id is also complete here ("66" inside "66b"), so the rest is optional
+            return (body if len(branches) > 1 or len(branches[0]) == 1 else "(?:" + body + ")") + "?"
+        return body
+
+    return render(trie)
+
+
+def _alternation(phrases):
+    return "(?:" + "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True)) + ")"
+
+
+class CorpusRouter:
+    """Routes templated section questions straight to the curated answer"""
+
+    def __init__(self, items):
+        # Canonical answers: "What is Section X of the IT Act?" items and section comparisons
+        self.answers = {}
+        self.comparisons = {}
+        for item in items:
+            instruction = normalize_instruction(item["instruction"])
+            sections = query_sections(instruction)
+            definition = re.fullmatch(r"what is section (\d+[a-z]?)" + ACT_PATTERN + r"(?: about)?", instruction)
+            if definition:
+                self.answers.setdefault(definition.group(1), item["output"])
+            elif "difference" in instruction and len(sections) == 2:
+                self.comparisons.setdefault(sections, item["output"])
+
+        compared = {section for pair in self.comparisons for section in pair}
+        section = trie_pattern(self.answers)
+        pair_section = trie_pattern(compared)
+        self.section_pattern = re.compile(
+            rf"(?:{_alternation(SECTION_PREFIXES)} )?section (?P<section>{section}){ACT_PATTERN}"
+            rf"(?: {_alternation(SECTION_SUFFIXES)})?"
+        ) if self.answers else None
+        self.comparison_pattern = re.compile(
+            rf"(?:{_alternation(COMPARISON_PREFIXES)} )?section (?P<a>{pair_section})"
+            rf" (?:and|vs|versus) (?:section )?(?P<b>{pair_section})(?: different)?"
+        ) if self.comparisons else None
+
+        self.routed = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataset(cls):
+        from cyber_saarthi.dataset_generator import CYBER_LAWS_DATA
+
+        return cls(CYBER_LAWS_DATA)
+
+    def match(self, instruction):
+        """The curated answer for instruction, or None when it is not a plain section lookup"""
+        text = normalize_instruction(instruction)
+        if self.section_pattern is not None:
+            match = self.section_pattern.fullmatch(text)
+            if match:
+                return self.answers[match.group("section")]
+        if self.comparison_pattern is not None:
+            match = self.comparison_pattern.fullmatch(text)
+            if match:
+                return self.comparisons.get(frozenset((match.group("a"), match.group("b"))))
+        return None
+
+    def route(self, instruction, input_text=""):
+        # Extra context means the caller wants more than the canonical answer
+        answer = self.match(instruction) if not input_text else None
+        with self._lock:
+            if answer is None:
+                self.fallbacks += 1
+            else:
+                self.routed += 1
+        return answer
+
+    def stats(self):
+        total = self.routed + self.fallbacks
+        return {
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "routed_rate": self.routed / total if total else 0.0,
+            "sections": len(self.answers),
+            "comparisons": len(self.comparisons),
+        }
+
+
+def build_router(router_config):
+    """Create the router described by `router` in config.yaml, or None"""
+    if not router_config or not router_config.get("enabled", False):
+        return None
+    return CorpusRouter.from_dataset()
@@ -0,0 +1,446 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+import torch
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from cyber_saarthi.inference import find_stop, kv_to_tensors, stream_safe_length, tensors_to_kv, truncate_at_stop
+from cyber_saarthi.stopping import StopOnStrings
+from cyber_saarthi.telemetry import NULL_TRACE
+
+
+_STREAM_END = object()
+
+
+def _left_pad(tensor, target_len, dim):
+    pad_len = target_len - tensor.shape[dim]
+    if pad_len <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = pad_len
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def build_logits_processors(temperature, top_p, top_k, repetition_penalty, do_sample):
+    # Same processors, in the same order, as model.generate builds for these settings
+    processors = LogitsProcessorList()
+    if repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+    if do_sample:
+        if temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(temperature))
+        if top_k > 0:
+            processors.append(TopKLogitsWarper(top_k))
+        if top_p < 1.0:
+            processors.append(TopPLogitsWarper(top_p))
+    return processors
+
+
+class GenerationRequest:
+
+    def __init__(
+        self, prompt_ids, max_new_tokens, temperature, top_p, top_k, repetition_penalty, do_sample, stream,
+        cache_args=None, stream_queue=None, trace=NULL_TRACE,
+    ):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.generated_ids = []
+        self.future = Future()
+        # Any object with put() works as the stream sink, e.g. AsyncStreamQueue for asyncio callers
+        self.stream_queue = stream_queue if stream_queue is not None else (queue.Queue() if stream else None)
+        self.cancelled = False
+        # "stop" (EOS or cached answer) or "length" (hit max_new_tokens), set once finished
+        self.finish_reason = None
+        self.streamed_text = ""
+        self.submitted_at = time.perf_counter()
+        # (instruction, input_text, gen_params) used to store the answer once finished
+        self.cache_args = cache_args
+        self.trace = trace
+
+        self.processors = build_logits_processors(temperature, top_p, top_k, repetition_penalty, do_sample)
+
+    def next_token(self, logits):
+        all_ids = torch.tensor([self.prompt_ids + self.generated_ids], device=logits.device)
+        scores = self.processors(all_ids, logits.unsqueeze(0).float())
+        if self.do_sample:
+            probs = torch.softmax(scores, dim=-1)
+            return int(torch.multinomial(probs, num_samples=1)[0, 0])
+        return int(scores.argmax(dim=-1)[0])
+
+    def cancel(self):
+        # Picked up by the scheduler thread at the next step, which frees the batch slot
+        self.cancelled = True
+
+
+class AsyncStreamQueue:
+    """Stream sink that hands chunks from the scheduler thread to an asyncio event loop."""
+
+    def __init__(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def put(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is _STREAM_END:
+            raise StopAsyncIteration
+        return item
+
+
+class ContinuousBatchingScheduler:
+    """Iteration-level scheduler that shares one CyberSaarthiModel between many callers.
+
+    Requests wait in a queue and are admitted into the running batch whenever a slot
+    frees up, so a short answer never waits for the longest answer in its batch.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_prompt_length=2048, idle_wait=0.05):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_prompt_length = max_prompt_length
+        self.idle_wait = idle_wait
+
+        self._queue = queue.Queue()
+        self._running = []
+        self._kv = None
+        self._attention_mask = None
+        self._last_tokens = None
+        self._stop = threading.Event()
+        self._stopping = None
+
+        self.steps = 0
+        self.generated_tokens = 0
+        self.completed_requests = 0
+        self._occupancy_sum = 0
+
+        self._thread = threading.Thread(target=self._loop, name="cyber-saarthi-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        instruction,
+        input_text="",
+        max_new_tokens=512,
+        temperature=0.7,
+        top_p=0.9,
+        top_k=50,
+        repetition_penalty=1.1,
+        do_sample=True,
+        stream=False,
+        stream_queue=None,
+    ):
+        if self._stop.is_set():
+            raise RuntimeError("Scheduler has been shut down")
+
+        gen_params = dict(
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=repetition_penalty,
+            do_sample=do_sample,
+        )
+        trace = self.model.telemetry.trace("scheduler")
+        with trace.stage("route"):
+            cached = self.model.route(instruction, input_text)
+        source = "router"
+        if cached is None:
+            with trace.stage("retrieve"):
+                input_text = self.model.retrieve_context(instruction, input_text)
+            with trace.stage("cache_lookup"):
+                cached = self.model.cache_lookup(instruction, input_text, gen_params)
+            source = "cache"
+        if cached is not None:
+            trace.finish(source=source)
+            # Answer straight from the corpus router or response cache without touching the batch
+            request = GenerationRequest([], stream=stream, stream_queue=stream_queue, **gen_params)
+            request.finish_reason = "stop"
+            if request.stream_queue is not None:
+                request.stream_queue.put(cached)
+                request.stream_queue.put(_STREAM_END)
+            request.future.set_result(cached)
+            return request
+
+        self.model.wait_until_loaded()
+        prompt = self.model.format_prompt(instruction, input_text)
+        with trace.stage("tokenize"):
+            prompt_ids = self.model.tokenizer(prompt, truncation=True, max_length=self.max_prompt_length)["input_ids"]
+        trace.prompt_tokens = len(prompt_ids)
+        request = GenerationRequest(
+            prompt_ids, stream=stream, stream_queue=stream_queue, cache_args=(instruction, input_text, gen_params),
+            trace=trace, **gen_params,
+        )
+        self._queue.put(request)
+        return request
+
+    def generate(self, instruction, **kwargs):
+        return self.submit(instruction, **kwargs).future.result()
+
+    async def agenerate(self, instruction, **kwargs):
+        return await asyncio.wrap_future(self.submit(instruction, **kwargs).future)
+
+    def stream(self, instruction, **kwargs):
+        request = self.submit(instruction, stream=True, **kwargs)
+        try:
+            while True:
+                chunk = request.stream_queue.get()
+                if chunk is _STREAM_END:
+                    break
+                yield chunk
+            # Surface any generation error to the streaming caller
+            request.future.result()
+        finally:
+            # The consumer dropped the generator early (Streamlit rerun, Stop): free the batch slot
+            request.cancel()
+
+    async def astream(self, instruction, **kwargs):
+        request = self.submit(instruction, stream_queue=AsyncStreamQueue(), **kwargs)
+        try:
+            async for chunk in request.stream_queue:
+                yield chunk
+            await asyncio.wrap_future(request.future)
+        finally:
+            # The consumer went away early (disconnect, timeout): stop generating for it
+            request.cancel()
+
+    def stats(self):
+        return {
+            "steps": self.steps,
+            "generated_tokens": self.generated_tokens,
+            "completed_requests": self.completed_requests,
+            "running": len(self._running),
+            "queued": self._queue.qsize(),
+            "avg_batch_occupancy": self._occupancy_sum / self.steps if self.steps else 0.0,
+        }
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        if wait:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._admit()
+                if not self._running:
+                    continue
+                self._decode_step()
+            except Exception as e:
+                for request in self._running:
+                    self._finish(request, error=e)
+                self._running = []
+                self._kv = self._attention_mask = self._last_tokens = None
+
+        for request in self._running:
+            self._finish(request, error=RuntimeError("Scheduler shut down"))
+        while not self._queue.empty():
+            self._finish(self._queue.get_nowait(), error=RuntimeError("Scheduler shut down"))
+
+    def _admit(self):
+        free_slots = self.max_batch_size - len(self._running)
+        if free_slots <= 0:
+            return
+
+        new_requests = []
+        try:
+            # Block briefly only when there is nothing to decode
+            if not self._running:
+                new_requests.append(self._queue.get(timeout=self.idle_wait))
+            while len(new_requests) < free_slots:
+                new_requests.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        admitted = []
+        for request in new_requests:
+            if not request.cancelled and request.future.set_running_or_notify_cancel():
+                admitted.append(request)
+            else:
+                self._finish(request)
+        new_requests = admitted
+        if not new_requests:
+            return
+
+        started = time.perf_counter()
+        for request in new_requests:
+            request.trace.add_stage("queue", started - request.submitted_at)
+        try:
+            kv, attention_mask, last_tokens = self._prefill(new_requests)
+            # The whole batched prefill counts against each request in it
+            elapsed = time.perf_counter() - started
+            for request in new_requests:
+                request.trace.add_stage("prefill", elapsed)
+        except Exception as e:
+            for request in new_requests:
+                self._finish(request, error=e)
+            return
+        if not self._running:
+            self._kv, self._attention_mask, self._last_tokens = kv, attention_mask, last_tokens
+        else:
+            # Left-pad both groups to a common cache length and stack them along the batch dim
+            target_len = max(self._attention_mask.shape[1], attention_mask.shape[1])
+            self._kv = [
+                [
+                    torch.cat([_left_pad(old, target_len, 2), _left_pad(new, target_len, 2)], dim=0)
+                    for old, new in zip(old_layer, new_layer)
+                ]
+                for old_layer, new_layer in zip(self._kv, kv)
+            ]
+            self._attention_mask = torch.cat(
+                [_left_pad(self._attention_mask, target_len, 1), _left_pad(attention_mask, target_len, 1)], dim=0
+            )
+            self._last_tokens = torch.cat([self._last_tokens, last_tokens], dim=0)
+        self._running.extend(new_requests)
+        self._retire_finished()
+
+    @torch.no_grad()
+    def _prefill(self, requests):
+        inputs = self.model.build_prefill_batch([r.prompt_ids for r in requests])
+        attention_mask = inputs["attention_mask"]
+        position_ids = (attention_mask.cumsum(dim=1) - 1).clamp(min=0)
+        past_key_values = inputs.get("past_key_values", DynamicCache())
+        # Tokens already covered by the shared preamble cache are not fed again
+        n_cached = past_key_values.get_seq_length()
+
+        outputs = self.model.model(
+            input_ids=inputs["input_ids"][:, n_cached:],
+            attention_mask=attention_mask,
+            position_ids=position_ids[:, n_cached:],
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        last_tokens = self._sample(requests, outputs.logits[:, -1, :])
+        return kv_to_tensors(outputs.past_key_values), attention_mask, last_tokens
+
+    @torch.no_grad()
+    def _decode_step(self):
+        started = time.perf_counter()
+        # The cache holds every token except the last sampled one, which is fed in now
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True)
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._running), 1))], dim=1
+        )
+
+        outputs = self.model.model(
+            input_ids=self._last_tokens.unsqueeze(1),
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=tensors_to_kv(self._kv),
+            use_cache=True,
+        )
+        self._kv = kv_to_tensors(outputs.past_key_values)
+        self._last_tokens = self._sample(self._running, outputs.logits[:, -1, :])
+        if self.model.telemetry.enabled:
+            elapsed = time.perf_counter() - started
+            for request in self._running:
+                request.trace.add_stage("decode", elapsed)
+
+        self.steps += 1
+        self._occupancy_sum += len(self._running)
+        self._retire_finished()
+
+    def _sample(self, requests, logits):
+        tokens = []
+        for request, row_logits in zip(requests, logits):
+            token = request.next_token(row_logits)
+            request.generated_ids.append(token)
+            if len(request.generated_ids) == 1:
+                request.trace.mark_first_token()
+            tokens.append(token)
+            if request.stream_queue is not None:
+                self._push_stream(request)
+        self.generated_tokens += len(tokens)
+        return torch.tensor(tokens, device=logits.device)
+
+    def _push_stream(self, request):
+        # Decode the whole answer so far so sentencepiece word boundaries come out right
+        text = self.model.tokenizer.decode(request.generated_ids, skip_special_tokens=True)
+        if text.endswith("�"):
+            return
+        # Hold back anything that could turn out to be the start of a stop string
+        text = text[:stream_safe_length(text)]
+        if len(text) > len(request.streamed_text):
+            request.stream_queue.put(text[len(request.streamed_text):])
+            request.streamed_text = text
+
+    def _is_finished(self, request):
+        if self._stopping is None:
+            self._stopping = StopOnStrings(self.model.tokenizer)
+        return (
+            request.cancelled
+            or request.generated_ids[-1] == self.model.tokenizer.eos_token_id
+            or len(request.generated_ids) >= request.max_new_tokens
+            # A row that starts a new prompt leaves the batch right away
+            or self._stopping.is_stopped(request.generated_ids)
+        )
+
+    def _retire_finished(self):
+        keep = [i for i, r in enumerate(self._running) if not self._is_finished(r)]
+        if len(keep) == len(self._running):
+            return
+
+        for i, request in enumerate(self._running):
+            if i not in keep:
+                self._finish(request)
+        self._running = [self._running[i] for i in keep]
+        if not self._running:
+            self._kv = self._attention_mask = self._last_tokens = None
+            return
+
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        attention_mask = self._attention_mask.index_select(0, index)
+        # Drop leading columns that are padding for every remaining row
+        first_col = int((attention_mask.sum(dim=0) > 0).int().argmax())
+        self._attention_mask = attention_mask[:, first_col:]
+        self._kv = [[t.index_select(0, index)[:, :, first_col:, :] for t in layer] for layer in self._kv]
+        self._last_tokens = self._last_tokens.index_select(0, index)
+
+    def _finish(self, request, error=None):
+        if request.stream_queue is not None:
+            if error is None and not request.cancelled and request.generated_ids:
+                # Flush text held back for a stop string that never completed
+                text = truncate_at_stop(self.model.tokenizer.decode(request.generated_ids, skip_special_tokens=True))
+                if len(text) > len(request.streamed_text):
+                    request.stream_queue.put(text[len(request.streamed_text):])
+                    request.streamed_text = text
+            request.stream_queue.put(_STREAM_END)
+        request.trace.new_tokens = len(request.generated_ids)
+        if request.future.done():
+            request.trace.finish(error="cancelled" if request.cancelled else None)
+            return
+        if error is not None:
+            request.trace.finish(error=f"{type(error).__name__}: {error}")
+            request.future.set_exception(error)
+            return
+        if request.cancelled:
+            request.trace.finish(error="cancelled")
+            request.future.set_exception(CancelledError())
+            return
+        text = self.model.tokenizer.decode(request.generated_ids, skip_special_tokens=True)
+        stopped = find_stop(text) is not None or (
+            request.generated_ids and request.generated_ids[-1] == self.model.tokenizer.eos_token_id
+        )
+        request.finish_reason = "stop" if stopped else "length"
+        text = truncate_at_stop(text).strip()
+        if request.cache_args is not None:
+            self.model.cache_store(*request.cache_args, text)
+        request.trace.set(finish_reason=request.finish_reason)
+        request.trace.finish()
+        request.future.set_result(text)
+        self.completed_requests += 1
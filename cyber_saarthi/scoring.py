@@ -0,0 +1,252 @@
+"""
+Batch scoring of generated answers: keyword coverage, token-F1 and ROUGE-L.
+
+A keyword matches anywhere in the lowercased response, as test_model_accuracy always
+scored it ("password" also matches "passwords"); whole_words=True only counts complete
+words ("Section 43" then no longer matches inside "Section 43A"). Batches where most
+responses are checked against most keywords are matched with NumPy in one pass per
+keyword. Token-F1 and ROUGE-L are computed for the whole batch at once with NumPy.
+"""
+from itertools import compress
+
+import numpy as np
+
+from cyber_saarthi.cache import WORD_PATTERN
+
+
+def tokenize(text):
+    return WORD_PATTERN.findall((text or "").lower())
+
+
+# Batches checking at least this share of all (response, keyword) pairs are matched with
+# NumPy; sparser ones do one `in` per check
+DENSE_CHECK_RATIO = 0.5
+DENSE_MIN_RESPONSES = 256
+
+
+def _keyword_needle(keyword, whole_words):
+    if not whole_words:
+        return keyword.lower()
+    words = tokenize(keyword)
+    # A keyword without any word never matches as a whole word
+    return " " + " ".join(words) + " " if words else "\x00"
+
+
+def find_keywords(responses, keyword_lists, whole_words=False):
+    """The keywords of each list that occur in the matching response, in list order"""
+    if whole_words:
+        texts = [" " + " ".join(tokenize(response)) + " " for response in responses]
+    else:
+        texts = [(response or "").lower() for response in responses]
+    # Evaluation sets share one keyword list object per example, so read each list once
+    distinct = {id(keywords): keywords for keywords in keyword_lists}
+    vocabulary = set().union(*distinct.values())
+    checks = sum(map(len, keyword_lists))
+
+    if len(texts) < DENSE_MIN_RESPONSES or checks < DENSE_CHECK_RATIO * len(texts) * len(vocabulary):
+        if not whole_words:
+            # Lowering a short keyword in place is cheaper than looking up a lowered copy
+            return [[keyword for keyword in keywords if keyword.lower() in text]
+                    for text, keywords in zip(texts, keyword_lists)]
+        needles = {keyword: _keyword_needle(keyword, True) for keyword in vocabulary}
+        return [[keyword for keyword in keywords if needles[keyword] in text]
+                for text, keywords in zip(texts, keyword_lists)]
+
+    columns = {keyword: j for j, keyword in enumerate(vocabulary)}
+    hits = _find_dense(texts, [_keyword_needle(keyword, whole_words) for keyword in columns])
+    # Responses sharing a keyword list object read their hits as one block
+    groups = {}
+    for i, keywords in enumerate(keyword_lists):
+        groups.setdefault(id(keywords), (keywords, []))[1].append(i)
+    matches = [None] * len(texts)
+    for keywords, rows in groups.values():
+        block = hits[np.ix_(rows, [columns[keyword] for keyword in keywords])].tolist()
+        for i, row in zip(rows, block):
+            matches[i] = list(compress(keywords, row))
+    return matches
+
+
+def _find_dense(texts, needles):
+    """hits[i, j] is whether needles[j] occurs in texts[i], one NumPy pass per needle over the batch.
+
+    A needle is located by its rarest byte in the batch and then checked one byte at a
+    time at the surviving positions, so most needles only touch a few candidates. Both
+    sides are UTF-8, whose encoding never lets a needle match in the middle of a character.
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    needle_bytes = [needle.encode("utf-8") for needle in needles]
+    starts = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) + 1 for text in encoded], out=starts[1:])
+    # NUL between texts so no match spans two of them, and padding so no probe runs off the end
+    longest = max(map(len, needle_bytes), default=0)
+    data = np.frombuffer(b"\x00".join(encoded) + b"\x00" * (longest + 1), dtype=np.uint8)
+    frequency = np.bincount(data, minlength=256).tolist()
+
+    hits = np.zeros((len(texts), len(needles)), dtype=bool)
+    positions = {}
+    for j, needle in enumerate(needle_bytes):
+        if not needle:
+            hits[:, j] = True
+            continue
+        if 0 in needle:
+            continue  # NUL separates the texts; only the stand-in for word-less keywords has one
+        offsets = sorted(range(len(needle)), key=[frequency[byte] for byte in needle].__getitem__)
+        anchor = needle[offsets[0]]
+        if anchor not in positions:
+            positions[anchor] = np.flatnonzero(data == anchor)
+        candidates = positions[anchor] - offsets[0]
+        candidates = candidates[candidates >= 0]
+        for k in offsets[1:]:
+            if not len(candidates):
+                break
+            candidates = candidates[data[candidates + k] == needle[k]]
+        hits[np.searchsorted(starts, candidates, side="right") - 1, j] = True
+    return hits
+
+
+def keyword_scores(responses, keyword_lists, whole_words=False):
+    """Percentage of each response's keywords it contains (None without keywords), and the matches"""
+    matches = find_keywords(responses, keyword_lists, whole_words)
+    scores = [len(matched) / len(keywords) * 100 if keywords else None
+              for matched, keywords in zip(matches, keyword_lists)]
+    return scores, matches
+
+
+def encode_texts(texts, vocab):
+    """Token id arrays for texts, sharing vocab; repeated texts are tokenized once"""
+    encoded = {}
+    arrays = []
+    for text in texts:
+        if text not in encoded:
+            encoded[text] = np.array(
+                [vocab.setdefault(token, len(vocab)) for token in tokenize(text)], dtype=np.int64
+            )
+        arrays.append(encoded[text])
+    return arrays
+
+
+def token_f1_batch(predictions, references):
+    """SQuAD-style bag-of-words F1 for each prediction/reference pair"""
+    vocab = {}
+    pred_ids = encode_texts(predictions, vocab)
+    ref_ids = encode_texts(references, vocab)
+    return _token_f1(pred_ids, ref_ids, len(vocab))
+
+
+def _token_f1(pred_ids, ref_ids, vocab_size):
+    n = len(pred_ids)
+    pred_lengths = np.array([len(ids) for ids in pred_ids], dtype=np.float64)
+    ref_lengths = np.array([len(ids) for ids in ref_ids], dtype=np.float64)
+    if n == 0:
+        return np.zeros(0)
+
+    def pair_counts(ids_list):
+        # One key per (pair, token); counting keys gives every pair's bag of words at once
+        keys = np.concatenate([ids + i * vocab_size for i, ids in enumerate(ids_list)] or [np.zeros(0, np.int64)])
+        return np.unique(keys, return_counts=True)
+
+    pred_keys, pred_counts = pair_counts(pred_ids)
+    ref_keys, ref_counts = pair_counts(ref_ids)
+    _, pred_at, ref_at = np.intersect1d(pred_keys, ref_keys, assume_unique=True, return_indices=True)
+    common = np.minimum(pred_counts[pred_at], ref_counts[ref_at])
+    overlap = np.bincount(pred_keys[pred_at] // max(vocab_size, 1), weights=common, minlength=n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(pred_lengths > 0, overlap / pred_lengths, 0.0)
+        recall = np.where(ref_lengths > 0, overlap / ref_lengths, 0.0)
+        f1 = np.where(overlap > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return f1
+
+
+def rouge_l_batch(predictions, references, chunk_size=512):
+    """ROUGE-L F1 (longest common subsequence of words) for each pair.
+
+    The LCS table is filled one prediction token at a time for a whole chunk of pairs:
+    with cand[j] = max(L[j], L[j-1] + 1 if the tokens match), the new row is the running
+    maximum of cand, which NumPy computes in one call. Pairs are sorted by length so a
+    chunk carries little padding.
+    """
+    vocab = {}
+    return _rouge_l(encode_texts(predictions, vocab), encode_texts(references, vocab), chunk_size)
+
+
+def _rouge_l(pred_ids, ref_ids, chunk_size=512):
+    scores = np.zeros(len(pred_ids))
+    order = sorted(range(len(pred_ids)), key=lambda i: (len(ref_ids[i]), len(pred_ids[i])))
+
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start:start + chunk_size]
+        pred_lengths = np.array([len(pred_ids[i]) for i in chunk])
+        ref_lengths = np.array([len(ref_ids[i]) for i in chunk])
+        width = max(int(ref_lengths.max()), 1)
+        steps = int(pred_lengths.max())
+        # Different pad values, so padding never matches padding
+        refs = np.full((len(chunk), width), -1, dtype=np.int64)
+        preds = np.full((len(chunk), max(steps, 1)), -2, dtype=np.int64)
+        for row, i in enumerate(chunk):
+            refs[row, :len(ref_ids[i])] = ref_ids[i]
+            preds[row, :len(pred_ids[i])] = pred_ids[i]
+
+        table = np.zeros((len(chunk), width + 1), dtype=np.int32)
+        for step in range(steps):
+            matches = refs == preds[:, step:step + 1]
+            cand = np.maximum(table[:, 1:], np.where(matches, table[:, :-1] + 1, 0))
+            table[:, 1:] = np.maximum.accumulate(cand, axis=1)
+        # Padded reference positions never match, so the last column holds the LCS
+        lcs = table[:, -1].astype(np.float64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(pred_lengths > 0, lcs / pred_lengths, 0.0)
+            recall = np.where(ref_lengths > 0, lcs / ref_lengths, 0.0)
+            scores[chunk] = np.where(lcs > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return scores
+
+
+def score_responses(responses, examples, whole_words=False):
+    """Keyword score, token-F1 and ROUGE-L for each response.
+
+    examples need "keywords" and may have "reference"; overlap metrics are None where
+    there is no reference text.
+    """
+    keyword_lists = [example.get("keywords") or [] for example in examples]
+    references = [example.get("reference") or "" for example in examples]
+    # Tokenize and encode once for both overlap metrics
+    vocab = {}
+    pred_ids = encode_texts(responses, vocab)
+    ref_ids = encode_texts(references, vocab)
+    scores, matches = keyword_scores(responses, keyword_lists, whole_words)
+    f1 = _token_f1(pred_ids, ref_ids, len(vocab))
+    rouge = _rouge_l(pred_ids, ref_ids)
+    results = []
+    for i, example in enumerate(examples):
+        has_reference = bool(references[i])
+        results.append({
+            "keyword_score": scores[i],
+            "matched": matches[i],
+            "missing": [keyword for keyword in keyword_lists[i] if keyword not in matches[i]],
+            "token_f1": float(f1[i]) * 100 if has_reference else None,
+            "rouge_l": float(rouge[i]) * 100 if has_reference else None,
+        })
+    return results
+
+
+METRICS = ("keyword_score", "token_f1", "rouge_l")
+
+
+def aggregate(results, metrics=METRICS):
+    """Mean of each metric overall and per category, skipping examples without that metric"""
+    def means(rows):
+        summary = {}
+        for metric in metrics:
+            values = [row[metric] for row in rows if row.get(metric) is not None]
+            summary[metric] = sum(values) / len(values) if values else None
+        summary["count"] = len(rows)
+        return summary
+
+    categories = {}
+    for row in results:
+        categories.setdefault(row.get("category", "General"), []).append(row)
+    return {
+        "overall": means(results),
+        "by_category": {name: means(rows) for name, rows in sorted(categories.items())},
+    }
@@ -0,0 +1,479 @@
+"""
+OpenAI-compatible HTTP inference server for Cyber Saarthi.
+
+Runs on the standard library's asyncio: the event loop only parses HTTP and shuttles
+tokens, while a single ContinuousBatchingScheduler thread owns the model and batches
+every in-flight request together.
+
+    python -m cyber_saarthi.server --port 8000
+    python -m cyber_saarthi.server --tiny-model   # offline smoke test, random weights
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from cyber_saarthi.inference import load_config, load_model_from_config
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message, error_type="invalid_request_error", headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+        self.headers = headers or {}
+
+
+class InferenceServer:
+    """Serves /v1/chat/completions, /v1/completions, /v1/models, /health and /metrics.
+
+    Requests beyond max_pending_requests are rejected with 429 instead of queueing
+    without bound, and every generation is cancelled once request_timeout expires so
+    the batch slot goes to the next caller.
+    """
+
+    def __init__(
+        self,
+        model,
+        scheduler,
+        generation_config=None,
+        model_name="cyber-saarthi",
+        request_timeout=120.0,
+        max_pending_requests=64,
+    ):
+        self.model = model
+        self.scheduler = scheduler
+        self.generation_config = generation_config or {}
+        self.model_name = model_name
+        self.request_timeout = request_timeout
+        self.max_pending_requests = max_pending_requests
+
+        self.in_flight = 0
+        self.total_requests = 0
+        self.rejected_requests = 0
+        self.timed_out_requests = 0
+        self.started_at = time.time()
+
+    async def serve(self, host="0.0.0.0", port=8000):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"✓ Serving {self.model_name} on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                keep_alive = await self._dispatch(method, path, body, writer, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None  # client closed an idle keep-alive connection
+            raise HTTPError(400, "Incomplete request headers")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "Request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length header")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length header")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method, path, body, writer, keep_alive):
+        routes = {
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+            "/v1/models": ("GET", self._models),
+            "/v1/chat/completions": ("POST", self._chat_completions),
+            "/v1/completions": ("POST", self._completions),
+        }
+        try:
+            if path not in routes:
+                raise HTTPError(404, f"Unknown path {path}", "not_found_error")
+            expected_method, handler = routes[path]
+            if method != expected_method:
+                raise HTTPError(405, f"{path} only accepts {expected_method}")
+            if method == "GET":
+                status, payload = handler()
+                if isinstance(payload, str):
+                    await self._send_text(writer, status, payload, keep_alive)
+                else:
+                    await self._send_json(writer, status, payload, keep_alive)
+                return keep_alive
+            return await handler(self._parse_json(body), writer, keep_alive)
+        except HTTPError as e:
+            await self._send_error(writer, e, keep_alive)
+            return keep_alive
+        except ConnectionError:
+            return False
+        except Exception as e:
+            await self._send_error(writer, HTTPError(500, str(e), "server_error"), keep_alive=False)
+            return False
+
+    def _parse_json(self, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return payload
+
+    # ---- GET endpoints ----
+
+    def _health(self):
+        # 200 only once the model is loaded and warmed up, so load balancers can gate traffic on it
+        health = self.model.health()
+        payload = {
+            "status": "ready" if health["ready"] else ("error" if health["error"] else "loading"),
+            **health,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "rejected_requests": self.rejected_requests,
+            "timed_out_requests": self.timed_out_requests,
+            "scheduler": self.scheduler.stats(),
+            "router": self.model.router.stats() if self.model.router is not None else None,
+        }
+        return (200 if health["ready"] else 503), payload
+
+    def _metrics(self):
+        # Prometheus text format; only the server gauges unless telemetry is enabled
+        lines = [
+            "# TYPE cyber_saarthi_in_flight_requests gauge",
+            f"cyber_saarthi_in_flight_requests {self.in_flight}",
+            "# TYPE cyber_saarthi_rejected_requests_total counter",
+            f"cyber_saarthi_rejected_requests_total {self.rejected_requests}",
+            "# TYPE cyber_saarthi_timed_out_requests_total counter",
+            f"cyber_saarthi_timed_out_requests_total {self.timed_out_requests}",
+        ]
+        return 200, "\n".join(lines) + "\n" + self.model.telemetry.prometheus_text()
+
+    def _models(self):
+        return 200, {
+            "object": "list",
+            "data": [{"id": self.model_name, "object": "model", "created": int(self.started_at), "owned_by": "cyber-saarthi"}],
+        }
+
+    # ---- completions ----
+
+    async def _chat_completions(self, payload, writer, keep_alive):
+        messages = payload.get("messages")
+        if not isinstance(messages, list) or not messages:
+            raise HTTPError(400, "'messages' must be a non-empty list")
+        # The model was tuned on single-turn instructions, so the latest user turn is the question
+        user_messages = [m for m in messages if isinstance(m, dict) and m.get("role") == "user"]
+        if not user_messages or not isinstance(user_messages[-1].get("content"), str):
+            raise HTTPError(400, "'messages' must contain a user message with string content")
+        return await self._run(payload, user_messages[-1]["content"], "chat", writer, keep_alive)
+
+    async def _completions(self, payload, writer, keep_alive):
+        prompt = payload.get("prompt")
+        if isinstance(prompt, list) and len(prompt) == 1:
+            prompt = prompt[0]
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "'prompt' must be a non-empty string")
+        return await self._run(payload, prompt, "text", writer, keep_alive)
+
+    def _generation_kwargs(self, payload):
+        defaults = self.generation_config
+        try:
+            kwargs = {
+                "max_new_tokens": int(payload.get("max_tokens") or defaults.get("max_new_tokens", 512)),
+                "temperature": float(payload.get("temperature", defaults.get("temperature", 0.7))),
+                "top_p": float(payload.get("top_p", defaults.get("top_p", 0.9))),
+                "top_k": int(payload.get("top_k", defaults.get("top_k", 50))),
+                "repetition_penalty": float(payload.get("repetition_penalty", defaults.get("repetition_penalty", 1.1))),
+            }
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, f"Invalid sampling parameter: {e}")
+        if kwargs["max_new_tokens"] <= 0:
+            raise HTTPError(400, "'max_tokens' must be positive")
+        if not 0 < kwargs["top_p"] <= 1:
+            raise HTTPError(400, "'top_p' must be in (0, 1]")
+        if kwargs["top_k"] < 0:
+            raise HTTPError(400, "'top_k' must be non-negative")
+        if not kwargs["repetition_penalty"] > 0:
+            raise HTTPError(400, "'repetition_penalty' must be positive")
+        if not kwargs["temperature"] >= 0:
+            raise HTTPError(400, "'temperature' must be non-negative")
+        # OpenAI clients ask for greedy decoding with temperature 0
+        kwargs["do_sample"] = defaults.get("do_sample", True) and kwargs["temperature"] > 0
+        if not kwargs["do_sample"]:
+            kwargs["temperature"] = 1.0
+        return kwargs
+
+    def _timeout(self, payload):
+        # Clients may shorten the deadline but never lift it
+        if "timeout" not in payload:
+            return self.request_timeout
+        timeout = payload["timeout"]
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout < float("inf"):
+            raise HTTPError(400, "'timeout' must be a positive number of seconds")
+        return min(timeout, self.request_timeout)
+
+    async def _run(self, payload, instruction, kind, writer, keep_alive):
+        if self.model.load_error is not None:
+            raise HTTPError(503, f"Model failed to load: {self.model.load_error}", "server_error")
+        if not self.model.is_loaded():
+            raise HTTPError(503, "Model is still loading", "server_error", {"Retry-After": "5"})
+        if self.in_flight >= self.max_pending_requests:
+            self.rejected_requests += 1
+            raise HTTPError(429, "Server is at capacity, retry shortly", "rate_limit_error", {"Retry-After": "1"})
+
+        kwargs = self._generation_kwargs(payload)
+        timeout = self._timeout(payload)
+        self.in_flight += 1
+        self.total_requests += 1
+        try:
+            if payload.get("stream"):
+                await self._run_stream(instruction, kwargs, kind, timeout, writer)
+                return False
+            await self._run_blocking(instruction, kwargs, kind, timeout, writer, keep_alive)
+            return keep_alive
+        finally:
+            self.in_flight -= 1
+
+    async def _submit(self, instruction, kwargs, stream=False):
+        from cyber_saarthi.scheduler import AsyncStreamQueue
+
+        stream_queue = AsyncStreamQueue(asyncio.get_running_loop()) if stream else None
+        # Cache lookups and tokenization run off the event loop
+        return await asyncio.to_thread(self.scheduler.submit, instruction, stream_queue=stream_queue, **kwargs)
+
+    async def _run_blocking(self, instruction, kwargs, kind, timeout, writer, keep_alive):
+        request = await self._submit(instruction, kwargs)
+        try:
+            text = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(request.future)), timeout)
+        except asyncio.TimeoutError:
+            request.cancel()
+            self.timed_out_requests += 1
+            raise HTTPError(504, f"Generation did not finish within {timeout}s", "timeout_error")
+
+        completion_id = f"{'chatcmpl' if kind == 'chat' else 'cmpl'}-{uuid.uuid4().hex}"
+        if kind == "chat":
+            choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": request.finish_reason}
+        else:
+            choice = {"index": 0, "text": text, "logprobs": None, "finish_reason": request.finish_reason}
+        response = {
+            "id": completion_id,
+            "object": "chat.completion" if kind == "chat" else "text_completion",
+            "created": int(time.time()),
+            "model": self.model_name,
+            "choices": [choice],
+            "usage": self._usage(request),
+        }
+        await self._send_json(writer, 200, response, keep_alive)
+
+    async def _run_stream(self, instruction, kwargs, kind, timeout, writer):
+        request = await self._submit(instruction, kwargs, stream=True)
+        completion_id = f"{'chatcmpl' if kind == 'chat' else 'cmpl'}-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta_text=None, finish_reason=None, role=None):
+            if kind == "chat":
+                delta = {}
+                if role:
+                    delta["role"] = role
+                if delta_text is not None:
+                    delta["content"] = delta_text
+                choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                obj = "chat.completion.chunk"
+            else:
+                choice = {"index": 0, "text": delta_text or "", "logprobs": None, "finish_reason": finish_reason}
+                obj = "text_completion"
+            return {"id": completion_id, "object": obj, "created": created, "model": self.model_name, "choices": [choice]}
+
+        writer.write(self._status_line(200, {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+        }))
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            if kind == "chat":
+                await self._send_event(writer, chunk(role="assistant", delta_text=""))
+            stream = request.stream_queue.__aiter__()
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    text = await asyncio.wait_for(stream.__anext__(), max(remaining, 0))
+                except StopAsyncIteration:
+                    break
+                await self._send_event(writer, chunk(delta_text=text))
+
+            try:
+                await asyncio.wrap_future(request.future)
+            except Exception as e:
+                await self._send_event(writer, {"error": {"message": str(e), "type": "server_error"}})
+            else:
+                final = chunk(finish_reason=request.finish_reason)
+                final["usage"] = self._usage(request)
+                await self._send_event(writer, final)
+            await self._send_event(writer, "[DONE]")
+        except asyncio.TimeoutError:
+            request.cancel()
+            self.timed_out_requests += 1
+            await self._send_event(writer, {"error": {"message": f"Generation did not finish within {timeout}s", "type": "timeout_error"}})
+            await self._send_event(writer, "[DONE]")
+        except (ConnectionError, asyncio.CancelledError):
+            # Client went away: free the batch slot right away
+            request.cancel()
+            raise
+
+    def _usage(self, request):
+        prompt_tokens = len(request.prompt_ids)
+        completion_tokens = len(request.generated_ids)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    # ---- HTTP writing ----
+
+    def _status_line(self, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer, status, payload, keep_alive, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **(extra_headers or {}),
+        }
+        writer.write(self._status_line(status, headers) + body)
+        await writer.drain()
+
+    async def _send_text(self, writer, status, text, keep_alive):
+        body = text.encode("utf-8")
+        headers = {
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        writer.write(self._status_line(status, headers) + body)
+        await writer.drain()
+
+    async def _send_error(self, writer, error, keep_alive):
+        payload = {"error": {"message": error.message, "type": error.error_type, "code": error.status}}
+        await self._send_json(writer, error.status, payload, keep_alive, error.headers)
+
+    async def _send_event(self, writer, data):
+        if not isinstance(data, str):
+            data = json.dumps(data, ensure_ascii=False)
+        writer.write(f"data: {data}\n\n".encode("utf-8"))
+        await writer.drain()
+
+
+def main():
+    import argparse
+
+    config = load_config()
+    server_config = config.get("server", {})
+    serving_config = config.get("serving", {})
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible Cyber Saarthi inference server")
+    parser.add_argument("--model-path", default="./models/cyber-saarthi/final", help="Path to the fine-tuned model")
+    parser.add_argument("--tiny-model", action="store_true",
+                        help="Serve a tiny random model (created on first use) for offline testing")
+    parser.add_argument("--host", default=server_config.get("host", "0.0.0.0"), help="Interface to bind")
+    parser.add_argument("--port", type=int, default=server_config.get("port", 8000), help="Port to listen on")
+    parser.add_argument("--max-batch-size", type=int, default=serving_config.get("max_batch_size", 8),
+                        help="Concurrent sequences in the running batch")
+    args = parser.parse_args()
+
+    from cyber_saarthi.scheduler import ContinuousBatchingScheduler
+
+    model_path = args.model_path
+    if args.tiny_model:
+        from cyber_saarthi.tiny_model import create_tiny_model
+
+        model_path = create_tiny_model("./models/tiny-random", tokenizer_path=args.model_path)
+    elif not os.path.exists(model_path):
+        print(f"Error: Model not found at {model_path}")
+        print("Please train the model first using: python -m cyber_saarthi.fine_tune")
+        return
+
+    # The port opens immediately; /health reports 503 until loading and warm-up finish
+    model = load_model_from_config(
+        model_path,
+        config,
+        warmup=serving_config.get("warmup", True),
+        background=serving_config.get("background_load", True),
+    )
+    scheduler = ContinuousBatchingScheduler(model, max_batch_size=args.max_batch_size)
+    server = InferenceServer(
+        model,
+        scheduler,
+        generation_config=config.get("generation", {}),
+        model_name=server_config.get("model_name", "cyber-saarthi"),
+        request_timeout=server_config.get("request_timeout", 120),
+        max_pending_requests=server_config.get("max_pending_requests", 64),
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
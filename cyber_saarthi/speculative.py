@@ -0,0 +1,244 @@
+"""
+Speculative decoding for CyberSaarthiModel.generate.
+
+A drafter proposes a few tokens cheaply. The full model then checks all of them in
+one forward pass and keeps the longest prefix it agrees with, plus one token of its
+own. Answers in this domain quote statutory text almost verbatim, so n-gram lookup
+in the dataset answers (and in the prompt itself) drafts long runs correctly.
+"""
+import json
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, DynamicCache
+
+from cyber_saarthi.scheduler import build_logits_processors
+
+
+def crop_cache(cache, length):
+    """Keep only the first `length` positions of a DynamicCache"""
+    # A negative crop removes that many tokens; a positive one (an absolute length) is deprecated
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        cache.crop(-excess)
+
+
+class NgramDrafter:
+    """Drafts the continuation of the longest n-gram that also occurs in the context or corpus"""
+
+    def __init__(self, sequences, num_draft_tokens=8, max_ngram=4, min_ngram=2):
+        self.sequences = sequences
+        self.num_draft_tokens = num_draft_tokens
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+        # n-gram -> (sequence index, position after the n-gram); first occurrence wins
+        self.index = {}
+        for seq_idx, ids in enumerate(sequences):
+            for n in range(min_ngram, max_ngram + 1):
+                for end in range(n, len(ids)):
+                    self.index.setdefault(tuple(ids[end - n:end]), (seq_idx, end))
+
+    @classmethod
+    def from_jsonl(cls, path, tokenizer, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            outputs = [json.loads(line)["output"] for line in f if line.strip()]
+        sequences = tokenizer(outputs, add_special_tokens=False)["input_ids"]
+        return cls(sequences, **kwargs)
+
+    def start(self, prompt_ids):
+        pass
+
+    def _lookup_context(self, ids, ngram, k):
+        n = len(ngram)
+        last = ngram[-1]
+        # Most recent earlier occurrence, excluding the n-gram at the very end
+        for end in range(len(ids) - 1, n - 1, -1):
+            if ids[end - 1] == last and tuple(ids[end - n:end]) == ngram:
+                return ids[end:end + k]
+        return []
+
+    def propose(self, ids, k):
+        for n in range(min(self.max_ngram, len(ids)), self.min_ngram - 1, -1):
+            ngram = tuple(ids[-n:])
+            draft = self._lookup_context(ids, ngram, k)
+            if draft:
+                return draft
+            hit = self.index.get(ngram)
+            if hit is not None:
+                seq_idx, pos = hit
+                return self.sequences[seq_idx][pos:pos + k]
+        return []
+
+
+class DraftModelDrafter:
+    """Drafts greedily with a smaller causal LM that shares the main model's vocabulary"""
+
+    def __init__(self, model, num_draft_tokens=4):
+        self.model = model
+        self.num_draft_tokens = num_draft_tokens
+        self.device = next(model.parameters()).device
+        self.cache = None
+        self.cached_ids = []
+
+    @classmethod
+    def from_pretrained(cls, path, tokenizer, torch_dtype=None, **kwargs):
+        model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch_dtype, trust_remote_code=True)
+        if model.config.vocab_size < len(tokenizer):
+            raise ValueError(f"Draft model {path} has a smaller vocabulary than the main model")
+        return cls(model.eval(), **kwargs)
+
+    def start(self, prompt_ids):
+        self.cache = DynamicCache()
+        self.cached_ids = []
+
+    @torch.no_grad()
+    def propose(self, ids, k):
+        # Keep the cache for the part of ids it has already seen; rejected drafts are dropped
+        common = 0
+        limit = min(len(self.cached_ids), len(ids) - 1)
+        while common < limit and self.cached_ids[common] == ids[common]:
+            common += 1
+        crop_cache(self.cache, common)
+
+        draft = []
+        feed = ids[common:]
+        for _ in range(k):
+            outputs = self.model(
+                input_ids=torch.tensor([feed], device=self.device), past_key_values=self.cache, use_cache=True
+            )
+            self.cache = outputs.past_key_values
+            token = int(outputs.logits[0, -1].argmax())
+            draft.append(token)
+            feed = [token]
+        # The last draft token was never fed, so the cache covers ids + draft[:-1]
+        self.cached_ids = list(ids) + draft[:-1]
+        return draft
+
+
+def build_drafter(speculative_config, tokenizer, torch_dtype=None):
+    speculative_config = speculative_config or {}
+    if not speculative_config.get("enabled", False):
+        return None
+    method = speculative_config.get("method", "ngram")
+    num_draft_tokens = speculative_config.get("num_draft_tokens", 8)
+    if method == "ngram":
+        return NgramDrafter.from_jsonl(
+            speculative_config.get("corpus_path", "./data/cyber_laws_qa.jsonl"),
+            tokenizer,
+            num_draft_tokens=num_draft_tokens,
+            max_ngram=speculative_config.get("max_ngram", 4),
+            min_ngram=speculative_config.get("min_ngram", 2),
+        )
+    if method == "draft_model":
+        if not speculative_config.get("draft_model"):
+            raise ValueError("speculative.draft_model must be set for method 'draft_model'")
+        return DraftModelDrafter.from_pretrained(
+            speculative_config["draft_model"], tokenizer, torch_dtype=torch_dtype, num_draft_tokens=num_draft_tokens
+        )
+    raise ValueError(f"Unknown speculative decoding method: {method}")
+
+
+def _choose(scores, do_sample):
+    if do_sample:
+        return int(torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)[0])
+    return int(scores.argmax())
+
+
+@torch.no_grad()
+def speculative_generate(model, inputs, drafter, gen_params, eos_token_id, stopping=None):
+    """Draft-then-verify decoding for a single prompt.
+
+    Greedy runs produce the same tokens as model.generate. Sampled runs accept a draft
+    token with the model's probability for it and otherwise resample from the rest,
+    which keeps the output distribution unchanged.
+
+    stopping (a StopOnStrings) ends the loop once the answer runs into a new prompt.
+    Returns the full sequence (prompt + new tokens) as a [1, n] tensor and the stats.
+    """
+    start = time.perf_counter()
+    max_new_tokens = gen_params["max_new_tokens"]
+    do_sample = gen_params["do_sample"]
+    processors = build_logits_processors(
+        gen_params["temperature"], gen_params["top_p"], gen_params["top_k"],
+        gen_params["repetition_penalty"], do_sample,
+    )
+    device = inputs["input_ids"].device
+    prompt_ids = inputs["input_ids"][0].tolist()
+    past_key_values = inputs.get("past_key_values", DynamicCache())
+    n_cached = past_key_values.get_seq_length()
+
+    def score(context, logits):
+        return processors(torch.tensor([context], device=device), logits.unsqueeze(0).float())[0]
+
+    # Batch of one without padding, so positions follow from the cache length
+    outputs = model(input_ids=inputs["input_ids"][:, n_cached:], past_key_values=past_key_values, use_cache=True)
+    past_key_values = outputs.past_key_values
+    generated = [_choose(score(prompt_ids, outputs.logits[0, -1]), do_sample)]
+    drafter.start(prompt_ids)
+
+    forward_passes = 1
+    draft_tokens = 0
+    accepted_tokens = 0
+    num_added = 1
+    while generated[-1] != eos_token_id and len(generated) < max_new_tokens:
+        if stopping is not None and stopping.is_stopped(generated, num_added):
+            break
+        previous_length = len(generated)
+        k = min(drafter.num_draft_tokens, max_new_tokens - len(generated) - 1)
+        draft = drafter.propose(prompt_ids + generated, k) if k > 0 else []
+        draft_tokens += len(draft)
+
+        outputs = model(
+            input_ids=torch.tensor([[generated[-1]] + draft], device=device),
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        past_key_values = outputs.past_key_values
+        forward_passes += 1
+
+        # logits[i] is the model's prediction for the position of draft[i]
+        for i, token in enumerate(draft):
+            scores = score(prompt_ids + generated, outputs.logits[0, i])
+            if do_sample:
+                probs = torch.softmax(scores, dim=-1)
+                if torch.rand(()) < probs[token]:
+                    generated.append(token)
+                    accepted_tokens += 1
+                    if token == eos_token_id:
+                        break
+                    continue
+                probs[token] = 0
+                generated.append(int(torch.multinomial(probs / probs.sum(), num_samples=1)[0]))
+                break
+            choice = int(scores.argmax())
+            generated.append(choice)
+            if choice != token:
+                break
+            accepted_tokens += 1
+            if token == eos_token_id:
+                break
+        else:
+            # Every draft token was accepted, so the last logits give one more for free
+            generated.append(_choose(score(prompt_ids + generated, outputs.logits[0, len(draft)]), do_sample))
+
+        # The cache must cover everything except the newest token, which is fed next round
+        crop_cache(past_key_values, len(prompt_ids) + len(generated) - 1)
+        num_added = len(generated) - previous_length
+
+    if eos_token_id in generated:
+        generated = generated[:generated.index(eos_token_id) + 1]
+    generated = generated[:max_new_tokens]
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "new_tokens": len(generated),
+        "forward_passes": forward_passes,
+        "draft_tokens": draft_tokens,
+        "accepted_tokens": accepted_tokens,
+        "acceptance_rate": accepted_tokens / draft_tokens if draft_tokens else 0.0,
+        "tokens_per_forward": len(generated) / forward_passes,
+        "elapsed_sec": elapsed,
+        "tokens_per_sec": len(generated) / elapsed if elapsed > 0 else 0.0,
+    }
+    return torch.tensor([prompt_ids + generated], device=device), stats
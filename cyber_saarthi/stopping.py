@@ -0,0 +1,41 @@
+"""
+Stopping criteria that end generation once the model starts a new prompt, or on request.
+"""
+import torch
+from transformers import StoppingCriteria
+
+from cyber_saarthi.inference import STOP_STRINGS, find_stop
+
+
+class StopOnStrings(StoppingCriteria):
+    """Stops each row on its own once its generated text contains a stop string.
+
+    Only the last few tokens are decoded per step, enough to hold the longest stop
+    string, so the check stays cheap next to a decoder forward pass.
+    """
+
+    def __init__(self, tokenizer, prompt_length=0, stop_strings=STOP_STRINGS):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop_strings = stop_strings
+        # A few spare tokens in case the string is tokenized differently mid-text
+        self.lookback = max(len(tokenizer(s, add_special_tokens=False)["input_ids"]) for s in stop_strings) + 4
+
+    def is_stopped(self, new_ids, num_added=1):
+        """new_ids are the generated tokens so far, num_added of them from the latest step"""
+        window = new_ids[-(self.lookback + num_added - 1):]
+        return find_stop(self.tokenizer.decode(window, skip_special_tokens=True), self.stop_strings) is not None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        rows = input_ids[:, self.prompt_length:].tolist()
+        return torch.tensor([self.is_stopped(ids) for ids in rows], dtype=torch.bool, device=input_ids.device)
+
+
+class StopOnEvent(StoppingCriteria):
+    """Stops every row once the event is set, e.g. when a streaming caller goes away"""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,316 @@
+"""
+Per-request stage timings for the inference hot path.
+
+Each generation call gets a RequestTrace that times its stages (routing, retrieval,
+cache lookup, tokenization, building the prefill batch on the device, prefill,
+decode, detokenization and stop-string trimming) and counts tokens. A finished trace
+is written as one JSON log line and added to Prometheus counters and histograms,
+which the server exposes on /metrics. Every Nth generation can also be recorded with
+torch.profiler as a Chrome trace.
+
+When telemetry is disabled, calls get NULL_TRACE, whose stages are a shared no-op
+context manager, so the hot path only pays a method call per stage.
+"""
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+# Histogram buckets in seconds, from a cache hit up to a long CPU generation
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullTrace:
+    """Stand-in trace used while telemetry is disabled; every call is a no-op"""
+
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def add_stage(self, name, seconds):
+        pass
+
+    def generation_timer(self):
+        return None
+
+    def mark_first_token(self):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+    def finish(self, source=None, error=None):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class GenerationTimer:
+    """Streamer for model.generate() that splits its time into prefill and decode.
+
+    generate() puts the prompt first and then every new token, so the first put after
+    the prompt marks the end of prefill.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self._seen_prompt = False
+
+    def put(self, value):
+        if not self._seen_prompt:
+            self._seen_prompt = True
+        elif self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            self.trace.mark_first_token()
+
+    def end(self):
+        now = time.perf_counter()
+        first = self.first_token_at or now
+        self.trace.add_stage("prefill", first - self.started_at)
+        self.trace.add_stage("decode", now - first)
+
+
+class RequestTrace:
+
+    enabled = True
+
+    def __init__(self, telemetry, kind, request_id):
+        self.telemetry = telemetry
+        self.kind = kind
+        self.request_id = request_id
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.stages = {}
+        self.prompt_tokens = 0
+        self.new_tokens = 0
+        self.attributes = {}
+        self.finished = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        # Stages entered more than once (one per batch, one per decode step) accumulate
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def generation_timer(self):
+        return GenerationTimer(self)
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, source="model", error=None):
+        if self.finished:
+            return
+        self.finished = True
+        self.total = time.perf_counter() - self.started_at
+        self.source = source
+        self.error = error
+        self.telemetry.record(self)
+
+    def as_dict(self):
+        ttft = self.first_token_at - self.started_at if self.first_token_at is not None else None
+        return {
+            "event": "generation",
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "source": self.source,
+            "error": self.error,
+            "total_ms": round(self.total * 1000, 3),
+            "ttft_ms": round(ttft * 1000, 3) if ttft is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "new_tokens": self.new_tokens,
+            "decode_tokens_per_sec": (
+                round(self.new_tokens / self.stages["decode"], 2) if self.stages.get("decode") else None
+            ),
+            **self.attributes,
+        }
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def exposition(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {self.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(self.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Telemetry:
+    """Collects finished RequestTraces into a JSON log and Prometheus metrics"""
+
+    def __init__(self, enabled=False, log=True, log_path=None, profile_dir=None, profile_every=0):
+        self.enabled = enabled
+        self.log = log
+        self.log_path = log_path
+        self.profile_dir = profile_dir
+        self.profile_every = profile_every
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._log_file = None
+        self.requests = {}  # (kind, source, outcome) -> count
+        self.tokens = {}  # (kind, type) -> count
+        self.request_seconds = {}  # (kind, source) -> Histogram
+        self.ttft_seconds = {}  # kind -> Histogram
+        self.stage_seconds = {}  # (kind, stage) -> Histogram
+
+    def trace(self, kind):
+        if not self.enabled:
+            return NULL_TRACE
+        return RequestTrace(self, kind, next(self._ids))
+
+    def profile(self, trace):
+        """torch.profiler around one generation, for every profile_every-th traced request"""
+        # One trace per request: a batched call is only profiled on its first batch
+        if (not (trace.enabled and self.profile_dir and self.profile_every) or trace.request_id % self.profile_every
+                or "profile_trace" in trace.attributes):
+            return _NULL_STAGE
+        return self._profile(trace)
+
+    @contextlib.contextmanager
+    def _profile(self, trace):
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities, record_shapes=True) as profiler:
+            yield
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"trace-{os.getpid()}-{trace.request_id}.json")
+        profiler.export_chrome_trace(path)
+        trace.set(profile_trace=path)
+
+    def record(self, trace):
+        outcome = "error" if trace.error else "ok"
+        ttft = trace.first_token_at - trace.started_at if trace.first_token_at is not None else None
+        with self._lock:
+            key = (trace.kind, trace.source, outcome)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for token_type, count in (("prompt", trace.prompt_tokens), ("generated", trace.new_tokens)):
+                self.tokens[(trace.kind, token_type)] = self.tokens.get((trace.kind, token_type), 0) + count
+            self.request_seconds.setdefault((trace.kind, trace.source), Histogram()).observe(trace.total)
+            if ttft is not None:
+                self.ttft_seconds.setdefault(trace.kind, Histogram()).observe(ttft)
+            for stage, seconds in trace.stages.items():
+                self.stage_seconds.setdefault((trace.kind, stage), Histogram()).observe(seconds)
+            if self.log:
+                self._write_log(json.dumps(trace.as_dict(), ensure_ascii=False))
+
+    def _write_log(self, line):
+        if self.log_path is None:
+            print(line, file=sys.stdout, flush=True)
+            return
+        if self._log_file is None:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+        self._log_file.write(line + "\n")
+
+    def prometheus_text(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP cyber_saarthi_requests_total Generation calls by kind, answer source and outcome.",
+                "# TYPE cyber_saarthi_requests_total counter",
+            ]
+            for (kind, source, outcome), count in sorted(self.requests.items()):
+                labels = [("kind", kind), ("source", source), ("outcome", outcome)]
+                lines.append(f"cyber_saarthi_requests_total{_labels(labels)} {count}")
+
+            lines += [
+                "# HELP cyber_saarthi_tokens_total Prompt and generated tokens.",
+                "# TYPE cyber_saarthi_tokens_total counter",
+            ]
+            for (kind, token_type), count in sorted(self.tokens.items()):
+                lines.append(f"cyber_saarthi_tokens_total{_labels([('kind', kind), ('type', token_type)])} {count}")
+
+            for name, help_text, histograms, label_names in (
+                ("cyber_saarthi_request_seconds", "End-to-end time of a generation call.",
+                 self.request_seconds, ("kind", "source")),
+                ("cyber_saarthi_time_to_first_token_seconds", "Time from the call to its first generated token.",
+                 self.ttft_seconds, ("kind",)),
+                ("cyber_saarthi_stage_seconds", "Time spent in each stage of a generation call.",
+                 self.stage_seconds, ("kind", "stage")),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for key, histogram in sorted(histograms.items()):
+                    values = key if isinstance(key, tuple) else (key,)
+                    lines += histogram.exposition(name, list(zip(label_names, values)))
+        return "\n".join(lines) + "\n"
+
+
+def build_telemetry(telemetry_config):
+    """Create the Telemetry described by the `telemetry` section of config.yaml"""
+    telemetry_config = telemetry_config or {}
+    return Telemetry(
+        enabled=telemetry_config.get("enabled", False),
+        log=telemetry_config.get("log", True),
+        log_path=telemetry_config.get("log_path"),
+        profile_dir=telemetry_config.get("profile_dir"),
+        profile_every=telemetry_config.get("profile_every", 0),
+    )
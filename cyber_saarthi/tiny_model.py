@@ -0,0 +1,51 @@
+import os
+
+
+def create_tiny_model(output_dir, tokenizer_path="./models/cyber-saarthi/final", seed=0):
+    """Save a randomly initialized, few-layer Llama with the real tokenizer.
+
+    It produces gibberish but exercises the exact same loading, batching and serving
+    code as the fine-tuned model, fully offline and in well under a second per request
+    on CPU. Used by the server, benchmarks and load tests.
+    """
+    import torch
+    from transformers import AutoTokenizer, LlamaConfig, LlamaForCausalLM
+
+    if os.path.exists(os.path.join(output_dir, "config.json")):
+        return output_dir
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    torch.manual_seed(seed)
+    model = LlamaForCausalLM(config)
+
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create a tiny random model for offline testing")
+    parser.add_argument("--output-dir", default="./models/tiny-random", help="Where to save the model")
+    parser.add_argument("--tokenizer-path", default="./models/cyber-saarthi/final", help="Tokenizer to reuse")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the weights")
+    args = parser.parse_args()
+
+    create_tiny_model(args.output_dir, args.tokenizer_path, args.seed)
+    print(f"✓ Tiny random model saved to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Multi-process model worker pool for many-core CPU nodes.
+
+One PyTorch process leaves most cores idle at small batch sizes. The pool instead
+starts several model processes, each pinned to its own subset of cores with a
+matching torch.set_num_threads. Weights are memory-mapped from the safetensors
+checkpoint, so every worker shares the same page-cache copy.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from cyber_saarthi.cache import make_cache_key
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(num_workers, cores=None):
+    """Split the cores into num_workers contiguous, equally sized groups"""
+    cores = sorted(cores) if cores is not None else available_cores()
+    if num_workers > len(cores):
+        # More workers than cores: oversubscribe one core each rather than refuse
+        return [[cores[i % len(cores)]] for i in range(num_workers)]
+    size = len(cores) // num_workers
+    return [cores[i * size:(i + 1) * size] for i in range(num_workers)]
+
+
+def _worker_main(worker_id, model_path, cores, cpu_config, max_batch_size, requests, results):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    cpu_config = dict(cpu_config or {}, num_threads=len(cores), mmap_weights=True)
+
+    try:
+        from cyber_saarthi.inference import CyberSaarthiModel
+
+        # The pool keeps the response cache in the parent so hits never reach a worker
+        model = CyberSaarthiModel(model_path, cpu_config=cpu_config)
+    except Exception as e:
+        results.put(("error", worker_id, str(e)))
+        return
+    results.put(("ready", worker_id, model.load_metrics))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        batch = [item]
+        # Whatever queued up while the previous batch ran goes into this one
+        while len(batch) < max_batch_size:
+            try:
+                item = requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                requests.put(None)
+                break
+            batch.append(item)
+
+        groups = {}
+        for request_id, instruction, input_text, gen_params in batch:
+            groups.setdefault(tuple(sorted(gen_params.items())), []).append((request_id, instruction, input_text))
+        for params, group in groups.items():
+            try:
+                texts = model.generate_batch(
+                    [instruction for _, instruction, _ in group],
+                    [input_text for _, _, input_text in group],
+                    batch_size=max_batch_size,
+                    **dict(params),
+                )
+                results.put(("batch", worker_id, [(request_id, text) for (request_id, _, _), text in zip(group, texts)],
+                             model.last_batch_stats, None))
+            except Exception as e:
+                results.put(("batch", worker_id, [(request_id, None) for request_id, _, _ in group], None, str(e)))
+
+
+class WorkerPool:
+    """Routes requests to the least-loaded of N pinned model processes.
+
+    Mirrors the ContinuousBatchingScheduler API (submit/generate/agenerate) so callers
+    can switch between one batched process and a pool of them.
+    """
+
+    def __init__(
+        self,
+        model_path,
+        num_workers=None,
+        cores=None,
+        cpu_config=None,
+        max_batch_size=8,
+        response_cache=None,
+        router=None,
+    ):
+        cores = cores if cores is not None else available_cores()
+        num_workers = num_workers or max(1, len(cores) // 4)
+        self.core_groups = partition_cores(num_workers, cores)
+        self.max_batch_size = max_batch_size
+        self.response_cache = response_cache
+        self.router = router
+
+        # spawn, not fork: forking a process that already runs torch threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        self._requests = [context.Queue() for _ in self.core_groups]
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(i, model_path, group, cpu_config, max_batch_size, self._requests[i], self._results),
+                name=f"cyber-saarthi-worker-{i}",
+                daemon=True,
+            )
+            for i, group in enumerate(self.core_groups)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+        self.outstanding = [0] * len(self._processes)
+        self.completed = [0] * len(self._processes)
+        self.generated_tokens = 0
+        self.cache_hits = 0
+        self.load_metrics = {}
+        self.load_errors = {}
+        self._dead = set()
+        self._ready = threading.Event()
+        self._closed = False
+
+        self._collector = threading.Thread(target=self._collect, name="cyber-saarthi-pool-collector", daemon=True)
+        self._collector.start()
+
+    @property
+    def num_workers(self):
+        return len(self._processes)
+
+    def wait_until_ready(self, timeout=None):
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Worker pool is still loading")
+        if self.load_errors:
+            raise RuntimeError(f"Workers failed to load: {self.load_errors}")
+
+    def submit(
+        self,
+        instruction,
+        input_text="",
+        max_new_tokens=512,
+        temperature=0.7,
+        top_p=0.9,
+        top_k=50,
+        repetition_penalty=1.1,
+        do_sample=True,
+    ):
+        if self._closed:
+            raise RuntimeError("Worker pool has been shut down")
+        gen_params = dict(
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=repetition_penalty,
+            do_sample=do_sample,
+        )
+        future = Future()
+        routed = self.router.route(instruction, input_text) if self.router is not None else None
+        if routed is not None:
+            future.set_result(routed)
+            return future
+        cache_key = None
+        if self.response_cache is not None and (not do_sample or self.response_cache.allow_sampled):
+            cache_key = make_cache_key(instruction, input_text, gen_params)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                future.set_result(cached)
+                return future
+
+        with self._lock:
+            alive = [i for i in range(self.num_workers) if i not in self._dead]
+            if not alive:
+                raise RuntimeError("No live workers in the pool")
+            # Least outstanding requests first; ties go to the lowest worker id
+            worker_id = min(alive, key=lambda i: self.outstanding[i])
+            self.outstanding[worker_id] += 1
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = (future, cache_key, worker_id)
+        self._requests[worker_id].put((request_id, instruction, input_text, gen_params))
+        return future
+
+    def generate(self, instruction, **kwargs):
+        return self.submit(instruction, **kwargs).result()
+
+    async def agenerate(self, instruction, **kwargs):
+        return await asyncio.wrap_future(self.submit(instruction, **kwargs))
+
+    def generate_batch(self, instructions, input_texts=None, **kwargs):
+        input_texts = input_texts or [""] * len(instructions)
+        futures = [self.submit(i, t, **kwargs) for i, t in zip(instructions, input_texts)]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        waiting = set(range(len(self._processes)))
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed:
+                    break
+                self._check_workers(waiting)
+                continue
+
+            kind, worker_id = message[0], message[1]
+            if kind in ("ready", "error"):
+                if kind == "ready":
+                    self.load_metrics[worker_id] = message[2]
+                else:
+                    self.load_errors[worker_id] = message[2]
+                    print(f"Error loading worker {worker_id}: {message[2]}")
+                waiting.discard(worker_id)
+                if not waiting:
+                    self._ready.set()
+                continue
+
+            _, _, answers, stats, error = message
+            with self._lock:
+                self.outstanding[worker_id] -= len(answers)
+                self.completed[worker_id] += len(answers)
+                if stats:
+                    self.generated_tokens += stats["new_tokens"]
+                pending = [self._pending.pop(request_id)[:2] + (text,) for request_id, text in answers]
+            for future, cache_key, text in pending:
+                if error is not None:
+                    future.set_exception(RuntimeError(f"Worker {worker_id} failed: {error}"))
+                    continue
+                if cache_key is not None:
+                    self.response_cache.set(cache_key, text)
+                future.set_result(text)
+
+    def _check_workers(self, waiting):
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive() or worker_id in self._dead:
+                continue
+            if worker_id in waiting:
+                self.load_errors[worker_id] = f"worker exited during startup (code {process.exitcode})"
+                waiting.discard(worker_id)
+                if not waiting:
+                    self._ready.set()
+            # A crashed worker never answers, so fail its requests instead of hanging the callers
+            with self._lock:
+                lost = [rid for rid, (_, _, wid) in self._pending.items() if wid == worker_id]
+                futures = [self._pending.pop(rid)[0] for rid in lost]
+                self._dead.add(worker_id)
+            for future in futures:
+                future.set_exception(RuntimeError(f"Worker {worker_id} exited (code {process.exitcode})"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "num_workers": self.num_workers,
+                "core_groups": self.core_groups,
+                "outstanding": list(self.outstanding),
+                "completed": list(self.completed),
+                "generated_tokens": self.generated_tokens,
+                "cache_hits": self.cache_hits,
+                "router": self.router.stats() if self.router is not None else None,
+            }
+
+    def shutdown(self, wait=True):
+        self._closed = True
+        for requests in self._requests:
+            requests.put(None)
+        if wait:
+            for process in self._processes:
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _, _ in pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Worker pool shut down"))
+
@@ -3,9 +3,11 @@
 Test script to evaluate the fine-tuned Cyber Saarthi model's accuracy
 """
 import sys
-sys.path.insert(0, '/home/karan/projects/cyber-saarthi')
+from pathlib import Path
 
-from cyber_saarthi.inference import CyberSaarthiModel
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from cyber_saarthi.evaluate import keyword_score, run_evaluation
 
 # Ground truth test cases with expected answers
 TEST_CASES = [
@@ -38,10 +40,7 @@ TEST_CASES = [
 
 def evaluate_response(response, expected_keywords):
     """Check how many expected keywords are in the response"""
-    response_lower = response.lower()
-    matches = [kw for kw in expected_keywords if kw.lower() in response_lower]
-    score = len(matches) / len(expected_keywords) * 100
-    return score, matches
+    return keyword_score(response, expected_keywords)
 
 def main():
     print("=" * 80)
@@ -49,7 +48,13 @@ def main():
     print("=" * 80)
     print("\nLoading model...")
     
-    model = CyberSaarthiModel("./models/cyber-saarthi/final")
+    examples = [
+        {"instruction": test["query"], "input": "", "keywords": test["expected_keywords"], "category": test["category"]}
+        for test in TEST_CASES
+    ]
+    # Greedy decoding, and answers are cached per checkpoint so reruns only re-score
+    evaluation, summary = run_evaluation("./models/cyber-saarthi/final", examples, max_new_tokens=256)
+    responses = [r["response"] for r in evaluation]
     
     print("\n" + "=" * 80)
     print("TESTING MODEL RESPONSES")
@@ -58,24 +63,17 @@ def main():
     total_score = 0
     results = []
     
-    for i, test in enumerate(TEST_CASES, 1):
+    stats = summary["generation_stats"]
+    if stats:
+        print(f"Generated {stats['new_tokens']} tokens in {stats['elapsed_sec']:.2f}s ({stats['tokens_per_sec']:.1f} tokens/sec)")
+    else:
+        print(f"All {summary['cached']} responses loaded from the evaluation cache")
+    
+    for i, (test, response) in enumerate(zip(TEST_CASES, responses), 1):
         print(f"\n[Test {i}/{len(TEST_CASES)}] Category: {test['category']}")
         print(f"Query: {test['query']}")
         print("-" * 80)
         
-        response = model.generate(
-            test['query'],
-            max_new_tokens=256,
-            temperature=0.7
-        )
-        
-        # Extract just the answer part
-        if "Below is an instruction" in response:
-            # Try to get just the generated answer
-            parts = response.split(test['query'])
-            if len(parts) > 1:
-                response = parts[-1].strip()
-        
         print(f"Response: {response[:500]}...")  # First 500 chars
         
         score, matches = evaluate_response(response, test['expected_keywords'])